@@ -0,0 +1,3 @@
+"""
+offline benchmarks of the bot's hot paths
+"""
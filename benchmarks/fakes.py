@@ -0,0 +1,159 @@
+"""
+contains lightweight stand-ins for discord messages, channels and interactions
+"""
+
+from types import SimpleNamespace
+from datetime import datetime, timezone
+
+
+def as_utc(dt):
+    """
+    Treat naive datetimes as UTC, like the bounds passed to channel.history.
+    """
+    if dt is None or dt.tzinfo is not None:
+        return dt
+    return dt.replace(tzinfo=timezone.utc)
+
+
+class FakeUser:
+    def __init__(self, user_id, name):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.color = 0
+        self.avatar = SimpleNamespace(
+            url=f"https://cdn.discordapp.com/avatars/{user_id}/hash.png"
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, FakeUser) and other.id == self.id
+
+    def __hash__(self):
+        return self.id
+
+
+class FakeAttachment:
+    def __init__(self, url, content_type):
+        self.url = url
+        self.content_type = content_type
+
+
+class FakeMessage:
+    def __init__(
+        self,
+        message_id,
+        author,
+        content="",
+        created_at=None,
+        channel=None,
+        embeds=None,
+        attachments=None,
+    ):
+        self.id = message_id
+        self.author = author
+        self.content = content
+        self.created_at = created_at or datetime.now(timezone.utc)
+        self.edited_at = None
+        self.channel = channel
+        self.embeds = embeds or []
+        self.attachments = attachments or []
+
+    async def add_reaction(self, emoji):
+        pass
+
+    async def edit(self, content=None, embed=None, embeds=None, **kwargs):
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embeds = [embed]
+        if embeds is not None:
+            self.embeds = list(embeds)
+        return self
+
+    async def pin(self):
+        pass
+
+    async def unpin(self):
+        pass
+
+    async def delete(self):
+        pass
+
+
+class FakeHistory:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def __aiter__(self):
+        return self.iterate()
+
+    async def iterate(self):
+        for m in self.messages:
+            yield m
+
+    async def flatten(self):
+        return list(self.messages)
+
+
+class FakeChannel:
+    """
+    Channel holding its messages oldest first.
+
+    Sent messages are kept only when keep_sent is set, so repeated runs stay comparable.
+    """
+
+    def __init__(self, channel_id, name, messages=None, keep_sent=False):
+        self.id = channel_id
+        self.name = name
+        self.messages = messages or []
+        self.by_id = {m.id: m for m in self.messages}
+        self.keep_sent = keep_sent
+        self.next_id = max(self.by_id, default=0) + 1
+        self.sent = 0
+
+    def history(self, limit=100, after=None, before=None, oldest_first=None):
+        after, before = as_utc(after), as_utc(before)
+        if oldest_first is None:
+            oldest_first = after is not None
+        messages = self.messages if oldest_first else reversed(self.messages)
+        selected = []
+        for m in messages:
+            if after is not None and m.created_at <= after:
+                continue
+            if before is not None and m.created_at >= before:
+                continue
+            selected.append(m)
+            if limit is not None and len(selected) >= limit:
+                break
+        return FakeHistory(selected)
+
+    async def fetch_message(self, message_id):
+        return self.by_id[message_id]
+
+    async def send(self, content=None, embed=None, embeds=None, **kwargs):
+        self.sent += 1
+        m = FakeMessage(
+            self.next_id,
+            None,
+            content or "",
+            channel=self,
+            embeds=[embed] if embed else list(embeds or []),
+        )
+        self.next_id += 1
+        if self.keep_sent:
+            self.messages.append(m)
+            self.by_id[m.id] = m
+        return m
+
+
+class FakeInteraction:
+    def __init__(self, author, channel):
+        self.author = author
+        self.user = author
+        self.channel = channel
+
+    async def defer(self):
+        pass
+
+    async def respond(self, *args, **kwargs):
+        pass
@@ -0,0 +1,324 @@
+"""
+Offline benchmarks of the on_message path, the board and report helpers and the
+command lookups, run against fake channels at realistic scale.
+
+Usage:
+    python -m benchmarks.hot_path [--output results.json] [--compare previous.json]
+"""
+
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+import tracemalloc
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import discord
+from src.core.init import cfg
+from src.core.badge import badge_index
+from src.core.cortana import cortana
+from src.core.dedup import archive_index
+from src.core.directory import directory
+from src.core.settings import settings
+from src.core.tools import format_units, modify_board, daily_report
+from src.func.commands import Cmd
+from src.func.functions import Func
+from benchmarks.fakes import (
+    FakeAttachment,
+    FakeChannel,
+    FakeInteraction,
+    FakeMessage,
+    FakeUser,
+)
+
+CHANNEL_SIZE = 10_000
+KEYWORD_CHANNELS = 10
+KEYWORDS_PER_CHANNEL = 200
+EMBED_CHANNELS = 10
+URLS_PER_CHANNEL = 50
+ARCHIVE_INDEX_SIZE = 5000
+
+CHARYS = FakeUser(101, "charys117")
+NOUVEE = FakeUser(102, "nouvee")
+DAY = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def make_config():
+    """
+    Build a config with large keyword and url tables.
+    """
+    board = {
+        "channel": "a-board",
+        "unit_1": "⭐",
+        "unit_10": "🌟",
+        "title": "Board",
+        "response": "Total",
+    }
+    return {
+        "guild_id": 1,
+        "timezone": 8,
+        "intents": "lean",
+        "archive_keyword": {
+            f"keyword-{i}": [f"kw{i}x{j}" for j in range(KEYWORDS_PER_CHANNEL)]
+            for i in range(KEYWORD_CHANNELS)
+        },
+        "archive_embed": {
+            f"embed-{i}": [f"site{i}-{j}.example.com" for j in range(URLS_PER_CHANNEL)]
+            for i in range(EMBED_CHANNELS)
+        },
+        "board": {"charys117": board, "nouvee": dict(board, channel="c-board")},
+        "user": {"charys117": CHARYS.id, "nouvee": NOUVEE.id},
+        "emoji": {"cortana": "🤖", "fate": "<:fate:1>"},
+        "cortana": {"cortana": {"display_name": "Cortana", "color": 0}},
+        "daily": {"channel": "chat"},
+    }
+
+
+def make_channels():
+    """
+    Build the fake channels, each big channel holding CHANNEL_SIZE messages.
+    """
+    authors = [CHARYS, NOUVEE]
+    chat = FakeChannel(1, "chat")
+    for i in range(CHANNEL_SIZE):
+        chat.messages.append(
+            FakeMessage(
+                i + 1,
+                authors[i % 2],
+                f"message {i}",
+                created_at=DAY + timedelta(seconds=i * 86400 / CHANNEL_SIZE),
+                channel=chat,
+            )
+        )
+    chat.by_id = {m.id: m for m in chat.messages}
+    bonus = FakeChannel(2, "bonus")
+    for i in range(CHANNEL_SIZE):
+        embed = discord.Embed(
+            title=f"**悬赏#{i + 1}**", description="内容: x\n奖励:\n⭐⭐⭐\n状态: 待完成"
+        )
+        bonus.messages.append(FakeMessage(i + 1, CHARYS, embeds=[embed], channel=bonus))
+    bonus.by_id = {m.id: m for m in bonus.messages}
+    badge = FakeChannel(3, "badge", keep_sent=True)
+    for i in range(CHANNEL_SIZE):
+        owner = FakeUser(1000 + i, f"owner{i}")
+        embed = discord.Embed(title="badge")
+        embed.set_footer(text="badge", icon_url=owner.avatar.url)
+        badge.messages.append(FakeMessage(i + 1, CHARYS, embeds=[embed], channel=badge))
+    badge.by_id = {m.id: m for m in badge.messages}
+    badge.next_id = CHANNEL_SIZE + 1
+    channels = {
+        "chat": chat,
+        "bonus": bonus,
+        "badge": badge,
+        "a-board": FakeChannel(
+            4, "a-board", [FakeMessage(1, CHARYS, "Board:\n⭐⭐\n2")], keep_sent=True
+        ),
+        "c-board": FakeChannel(
+            5, "c-board", [FakeMessage(1, NOUVEE, "Board:\n⭐⭐\n2")], keep_sent=True
+        ),
+        "record": FakeChannel(6, "record"),
+    }
+    for name in list(cfg["archive_keyword"]) + list(cfg["archive_embed"]):
+        channels[name] = FakeChannel(100 + len(channels), name)
+    return channels
+
+
+def setup():
+    """
+    Load the synthetic config and point the directory at the fake channels.
+    """
+    cfg.clear()
+    cfg.update(make_config())
+    settings._current = None
+    channels = make_channels()
+    directory.channel = channels.__getitem__
+    directory.member_ids.update({CHARYS.name: CHARYS.id, NOUVEE.name: NOUVEE.id})
+    cortana.name = "cortana"
+    return channels
+
+
+async def measure(name, op, seconds, results):
+    """
+    Run op repeatedly for about the given time, then once more under tracemalloc.
+
+    Args:
+        name (str): The name of the benchmark.
+        op (coroutine function): The operation to measure.
+        seconds (float): The time budget.
+        results (dict): The results to fill.
+    """
+    await op()
+    iterations = 0
+    start = time.perf_counter()
+    while True:
+        await op()
+        iterations += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            break
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    await op()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results[name] = {
+        "iterations": iterations,
+        "ops_per_sec": iterations / elapsed,
+        "mean_us": elapsed / iterations * 1e6,
+        "peak_alloc_bytes": peak - before,
+    }
+    print(
+        f"{name:<28} {iterations / elapsed:>12.1f} ops/s "
+        f"{elapsed / iterations * 1e6:>12.1f} us/op {peak - before:>10} B peak"
+    )
+
+
+async def run(seconds):
+    channels = setup()
+    results = {}
+    miss = FakeMessage(
+        1,
+        CHARYS,
+        "nothing to archive here " * 4,
+        attachments=[FakeAttachment("https://cdn/x.png", "image/png")],
+    )
+    hit = FakeMessage(
+        2,
+        CHARYS,
+        f"look {cfg['archive_keyword'][f'keyword-{KEYWORD_CHANNELS - 1}'][-1]}",
+        attachments=[FakeAttachment("https://cdn/x.png", "image/png")],
+    )
+    embed_miss = FakeMessage(3, CHARYS, "https://unknown.example.org/page")
+    embed_hit = FakeMessage(
+        4,
+        CHARYS,
+        f"https://site{EMBED_CHANNELS - 1}-{URLS_PER_CHANNEL - 1}.example.com/page",
+        embeds=[discord.Embed(title="link")],
+    )
+    interaction = FakeInteraction(CHARYS, channels["chat"])
+    bonus_embed = channels["bonus"].messages[0].embeds[0]
+    bonus_description = bonus_embed.description
+
+    async def archive_keyword_miss():
+        await Func.archive_keyword(miss)
+
+    async def archive_keyword_hit():
+        await Func.archive_keyword(hit)
+
+    async def archive_embed_miss():
+        await Func.archive_embed(embed_miss)
+
+    async def archive_embed_hit():
+        await Func.archive_embed(embed_hit)
+
+    async def board():
+        await modify_board("charys117", 1)
+
+    async def units():
+        format_units(["⭐", "🌟"], 9999)
+
+    async def report():
+        await daily_report(DAY.date())
+
+    async def done_oldest():
+        bonus_embed.description = bonus_description
+        await Cmd.done(interaction, 1)
+
+    async def award_lookup():
+        embed = discord.Embed(title="badge")
+        await badge_index.add(channels["badge"], 1000, embed)
+
+    async def award_index_build():
+        await badge_index.build(channels["badge"])
+
+    # an index at capacity, loaded already so nothing is read from disk
+    archive_index.entries = OrderedDict()
+    rng = random.Random(0)
+    for i in range(ARCHIVE_INDEX_SIZE):
+        archive_index.insert(
+            {"id": i, "size": i, "phash": rng.getrandbits(64), "sha256": None}
+        )
+    probe = rng.getrandbits(64)
+    new_image = FakeAttachment("https://cdn/new.png", "image/png")
+    new_image.size = ARCHIVE_INDEX_SIZE
+
+    async def thumbnail_hash(att):
+        # stands in for the media proxy round trip
+        return probe
+
+    archive_index.perceptual_hash = thumbnail_hash
+
+    async def dedup_lookup_miss():
+        await archive_index.lookup(new_image, {"phash": None, "sha256": None})
+
+    for name, op in [
+        ("archive_keyword_miss", archive_keyword_miss),
+        ("archive_keyword_hit", archive_keyword_hit),
+        ("archive_embed_miss", archive_embed_miss),
+        ("archive_embed_hit", archive_embed_hit),
+        ("modify_board", board),
+        ("format_units", units),
+        ("daily_report_10k", report),
+        ("done_oldest_of_10k", done_oldest),
+        ("award_lookup", award_lookup),
+        ("award_index_build_10k", award_index_build),
+        ("dedup_lookup_miss_5k", dedup_lookup_miss),
+    ]:
+        await measure(name, op, seconds, results)
+    return results
+
+
+def get_version():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, previous_path):
+    """
+    Print the ops/s ratio of every benchmark against a previous result file.
+    """
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = json.load(f)
+    print(f"\ncompared with {previous.get('version', previous_path)}:")
+    for name, result in results.items():
+        old = previous["results"].get(name)
+        if not old:
+            print(f"{name:<28} new")
+            continue
+        ratio = result["ops_per_sec"] / old["ops_per_sec"]
+        print(f"{name:<28} {ratio:>8.2f}x ops/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline hot-path benchmarks")
+    parser.add_argument("--seconds", type=float, default=1.0, help="time per benchmark")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare with a previous JSON result file")
+    args = parser.parse_args()
+    results = asyncio.run(run(args.seconds))
+    report = {
+        "version": get_version(),
+        "python": platform.python_version(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,100 +1,299 @@
 import os
-from datetime import time as datetime_time
-from discord.ext import tasks
-from src.core.init import bot, cfg, update_cfg, Log, tz
-from src.core.cortana import cortana
-from src.core.tools import warning
-from src.func.commands import Cmd
-from src.func.functions import Func
-
-log = Log.get("main")
-
-
-@bot.event
-async def on_ready():
-    log.info(f"We have logged in as {bot.user}")
-    update_cfg()
-    cortana.init()
-
-
-@bot.event
-async def on_message(message):
-    if message.author == bot.user:
-        return
-    if message.channel.name in ["chat", "night", "test"]:
-        if message.attachments and message.content:
-            await Func.archive_keyword(message)
-        elif "https://" in message.content or "http://" in message.content:
-            await Func.archive_embed(message)
-
-
-@bot.slash_command(description="戳戳", guild_ids=[cfg["guild_id"]])
-async def chuo(ctx):
-    await Cmd.chuo(ctx)
-
-
-@bot.slash_command(description="醒来提醒", guild_ids=[cfg["guild_id"]])
-async def awake(ctx):
-    await Cmd.awake(ctx)
-
-
-@bot.slash_command(description="发起悬赏", guild_ids=[cfg["guild_id"]])
-async def bonus(ctx):
-    await Cmd.bonus(ctx)
-
-
-@bot.slash_command(description="完成悬赏", guild_ids=[cfg["guild_id"]])
-async def done(ctx, index: int):
-    await Cmd.done(ctx, index)
-
-
-@bot.slash_command(description="切换形象", guild_ids=[cfg["guild_id"]])
-async def shift(ctx):
-    await Cmd.shift(ctx)
-
-
-@bot.slash_command(description="积分变更", guild_ids=[cfg["guild_id"]])
-async def record(ctx, description: str, quantity: int):
-    await Cmd.record(ctx, description, quantity)
-
-
-@bot.slash_command(description="转发#night消息", guild_ids=[cfg["guild_id"]])
-async def night(ctx):
-    await Cmd.night(ctx)
-
-
-@bot.slash_command(description="摇骰子", guild_ids=[cfg["guild_id"]])
-async def roll(ctx, num: int = 6):
-    await Cmd.roll(ctx, num)
-
-
-@bot.command(description="授勋", guild_ids=[cfg["guild_id"]])
-async def award(ctx, title: str, description: str):
-    await Cmd.award(ctx, title, description)
-
-
-@bot.command(description="手动每日Dropbox备份", guild_ids=[cfg["guild_id"]])
-async def backup_daily(ctx):
-    await Cmd.backup_daily(ctx)
-
-
-@bot.command(description="手动全部Dropbox备份", guild_ids=[cfg["guild_id"]])
-async def backup_all(ctx, start_date_str: str = None, end_date_str: str = None):
-    await Cmd.backup_all(ctx, start_date_str, end_date_str)
-
-
-@tasks.loop(time=datetime_time(0, 0, tzinfo=tz))
-async def daily():
-    try:
-        await Func.daily()
-    except Exception as e:
-        log.error(f"Daily failed: {e}")
+import time
+import asyncio
+import argparse
+import importlib
+from datetime import datetime
+
+# imported in this order by --profile-startup to attribute the import time
+STARTUP_MODULES = [
+    "yaml",
+    "httpx",
+    "discord",
+    "coloredlogs",
+    "src.core.init",
+    "src.core.metrics",
+    "src.core.mirror",
+    "src.core.settings",
+    "src.core.directory",
+    "src.core.tools",
+    "src.core.cortana",
+    "src.core.backup",
+    "src.core.badge",
+    "src.core.conversation",
+    "src.core.dedup",
+    "src.core.export",
+    "src.core.forward",
+    "src.core.manifest",
+    "src.core.notify",
+    "src.core.rest",
+    "src.core.rollup",
+    "src.core.scheduler",
+    "src.core.worker",
+    "src.func.commands",
+    "src.func.functions",
+]
+
+
+def create_app():
+    """
+    Load the config and build the bot with every event, command and task registered.
+
+    Returns:
+        discord.Bot: The bot, ready to run.
+    """
+    import discord
+    from discord.ext import tasks
+    from src.core.init import (
+        bot,
+        cfg,
+        close_http_clients,
+        load_config,
+        Log,
+        startup_report,
+    )
+    from src.core.backup import BACKUP_CH
+    from src.core.cortana import cortana
+    from src.core.directory import directory
+    from src.core.metrics import metrics
+    from src.core.mirror import mirror
+    from src.core.rest import rest
+    from src.core.rollup import rollups, GROUPS
+    from src.core.scheduler import scheduler, Job
+    from src.core.settings import settings
+    from src.core.conversation import conversations
+    from src.core.notify import notifier
+    from src.core.tools import warning
+    from src.func.commands import Cmd
+    from src.func.functions import Func
+
+    load_config()
+    Log.set_level("INFO")
+    log = Log.get("main")
+    directory.attach()
+    metrics.instrument(bot)
+    rest.install(bot)
+    mirror.attach(BACKUP_CH)
+    daily_at = datetime.strptime(cfg["daily"].get("time", "00:00"), "%H:%M").time()
+    scheduler.add(Job("greeting", Func.greeting, daily_at))
+    scheduler.add(Job("backup", Func.daily_backup, daily_at, catch_up_all=True))
+
+    async def report_failure(job, e):
         await warning(
-            f"每日备份失败: {e}",
-            channel=bot.get_channel(cfg["channel"][cfg["daily"]["channel"]]),
+            f"{job.name}失败: {e}", channel=directory.channel(cfg["daily"]["channel"])
         )
 
+    scheduler.on_error = report_failure
+
+    close = bot.close
+
+    async def close_all():
+        await close()
+        await notifier.close()
+        await close_http_clients()
+
+    # close the http pools when the bot shuts down
+    bot.close = close_all
+
+    @bot.event
+    async def on_ready():
+        log.info(f"We have logged in as {bot.user}")
+        log.info(startup_report())
+        directory.build()
+        cortana.init()
+        await metrics.start()
+        rollups.open()
+        mirror.start_sync()
+        for loop in [schedule, watch_config]:
+            if not loop.is_running():
+                loop.start()
+
+    @bot.event
+    async def on_message(message):
+        if message.author == bot.user:
+            return
+        if conversations.dispatch(message):
+            return
+        if message.channel.name in ["chat", "night", "test"]:
+            if message.attachments and message.content:
+                async with metrics.timer("handler_seconds", handler="archive_keyword"):
+                    await Func.archive_keyword(message)
+            elif "https://" in message.content or "http://" in message.content:
+                async with metrics.timer("handler_seconds", handler="archive_embed"):
+                    await Func.archive_embed(message)
+
+    @bot.event
+    async def on_application_command(ctx):
+        ctx.started = time.perf_counter()
+
+    @bot.event
+    async def on_application_command_completion(ctx):
+        metrics.observe(
+            "command_seconds",
+            time.perf_counter() - ctx.started,
+            command=ctx.command.qualified_name,
+            status="ok",
+        )
 
-daily.start()
+    @bot.event
+    async def on_application_command_error(ctx, error):
+        metrics.observe(
+            "command_seconds",
+            time.perf_counter() - getattr(ctx, "started", time.perf_counter()),
+            command=ctx.command.qualified_name,
+            status="error",
+        )
+        log.error(f"Command {ctx.command.qualified_name} failed: {error}", exc_info=error)
+
+    @bot.slash_command(description="戳戳", guild_ids=[cfg["guild_id"]])
+    async def chuo(ctx):
+        await Cmd.chuo(ctx)
+
+    @bot.slash_command(description="醒来提醒", guild_ids=[cfg["guild_id"]])
+    async def awake(ctx):
+        await Cmd.awake(ctx)
+
+    @bot.slash_command(description="发起悬赏", guild_ids=[cfg["guild_id"]])
+    async def bonus(ctx):
+        await Cmd.bonus(ctx)
+
+    @bot.slash_command(description="完成悬赏", guild_ids=[cfg["guild_id"]])
+    async def done(ctx, index: int):
+        await Cmd.done(ctx, index)
+
+    @bot.slash_command(description="切换形象", guild_ids=[cfg["guild_id"]])
+    async def shift(ctx):
+        await Cmd.shift(ctx)
+
+    @bot.slash_command(description="积分变更", guild_ids=[cfg["guild_id"]])
+    async def record(ctx, description: str, quantity: int):
+        await Cmd.record(ctx, description, quantity)
+
+    @bot.slash_command(description="转发#night消息", guild_ids=[cfg["guild_id"]])
+    async def night(ctx):
+        await Cmd.night(ctx)
+
+    @bot.slash_command(description="摇骰子", guild_ids=[cfg["guild_id"]])
+    async def roll(ctx, num: int = 6):
+        await Cmd.roll(ctx, num)
+
+    @bot.command(description="授勋", guild_ids=[cfg["guild_id"]])
+    async def award(ctx, title: str, description: str):
+        await Cmd.award(ctx, title, description)
+
+    @bot.command(description="重载配置", guild_ids=[cfg["guild_id"]])
+    async def reload_config(ctx):
+        await Cmd.reload_config(ctx)
+
+    @bot.command(description="输出监控指标", guild_ids=[cfg["guild_id"]])
+    async def dump_metrics(ctx):
+        await Cmd.dump_metrics(ctx)
+
+    @bot.command(description="定时任务状态", guild_ids=[cfg["guild_id"]])
+    async def jobs(ctx):
+        await Cmd.jobs(ctx)
+
+    @bot.slash_command(description="活动统计", guild_ids=[cfg["guild_id"]])
+    async def stats(
+        ctx,
+        group: discord.Option(str, choices=list(GROUPS)),
+        start_date_str: str,
+        end_date_str: str = None,
+        channel: discord.TextChannel = None,
+        then: discord.Option(str, choices=list(GROUPS), required=False) = None,
+        author: discord.Member = None,
+    ):
+        await Cmd.stats(
+            ctx, group, start_date_str, end_date_str, channel, then, author
+        )
 
-bot.run(os.environ["CORTANA_TOKEN"])
+    @bot.command(description="手动每日Dropbox备份", guild_ids=[cfg["guild_id"]])
+    async def backup_daily(ctx):
+        await Cmd.backup_daily(ctx)
+
+    @bot.command(description="手动全部Dropbox备份", guild_ids=[cfg["guild_id"]])
+    async def backup_all(ctx, start_date_str: str = None, end_date_str: str = None):
+        await Cmd.backup_all(ctx, start_date_str, end_date_str)
+
+    @bot.slash_command(description="导出频道记录", guild_ids=[cfg["guild_id"]])
+    async def export(
+        ctx, channel: discord.TextChannel, start_date_str: str, end_date_str: str = None
+    ):
+        await Cmd.export(ctx, channel, start_date_str, end_date_str)
+
+    @bot.command(description="校验备份", guild_ids=[cfg["guild_id"]])
+    async def verify(ctx, repair: bool = True, adopt: bool = False):
+        await Cmd.verify(ctx, repair, adopt)
+
+    @bot.command(description="取消备份", guild_ids=[cfg["guild_id"]])
+    async def backup_cancel(ctx):
+        await Cmd.backup_cancel(ctx)
+
+    @tasks.loop(seconds=30)
+    async def schedule():
+        scheduler.tick()
+
+    @tasks.loop(seconds=10)
+    async def watch_config():
+        settings.check()
+
+    return bot.get()
+
+
+def profile_startup():
+    """
+    Report the import time of every module, the time to build the app and the time to ready.
+    """
+    imports = []
+    for name in STARTUP_MODULES:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        imports.append((name, time.perf_counter() - start))
+    start = time.perf_counter()
+    bot = create_app()
+    build_time = time.perf_counter() - start
+
+    from src.core.init import Log, startup_report
+
+    log = Log.get("profile")
+
+    async def connect():
+        ready = asyncio.Event()
+
+        async def on_profile_ready():
+            ready.set()
+
+        bot.add_listener(on_profile_ready, "on_ready")
+        start = time.perf_counter()
+        runner = asyncio.create_task(bot.start(os.environ["CORTANA_TOKEN"]))
+        await ready.wait()
+        ready_time = time.perf_counter() - start
+        await bot.close()
+        await asyncio.gather(runner, return_exceptions=True)
+        return ready_time
+
+    ready_time = bot.loop.run_until_complete(connect())
+    for name, seconds in sorted(imports, key=lambda item: item[1], reverse=True):
+        log.info(f"import {name}: {seconds * 1000:.1f}ms")
+    log.info(f"imports total: {sum(s for _, s in imports) * 1000:.1f}ms")
+    log.info(f"create_app: {build_time * 1000:.1f}ms")
+    log.info(f"login to ready: {ready_time:.2f}s")
+    log.info(startup_report())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cortana discord bot")
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="report import time and time-to-ready, then exit",
+    )
+    args = parser.parse_args()
+    if args.profile_startup:
+        profile_startup()
+    else:
+        create_app().run(os.environ["CORTANA_TOKEN"])
+
+
+if __name__ == "__main__":
+    main()
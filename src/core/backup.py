@@ -3,12 +3,47 @@ contains functions for backing up messages
 """
 
 import os
+import re
+import json
+import asyncio
 from os.path import join as pj
 from datetime import timedelta, datetime
 import mimetypes
 from urllib.parse import urlparse
 import discord
-from src.core.init import cfg, httpx_client, bot, tz, Log
+import httpx
+from src.core.init import cfg, cdn_client, tz, Log
+from src.core.directory import directory
+from src.core.manifest import manifest
+from src.core.media import media, THUMB_DIR
+from src.core.mentions import MentionResolver
+from src.core.metrics import metrics
+from src.core.mirror import mirror
+from src.core.rest import rest
+
+BACKUP_BY_DATE_CH = ["chat", "night"]
+BACKUP_IN_ONE_FILE_CH = [
+    "record",
+    "tutorials",
+    "references",
+    "gallery",
+    "food",
+    "meme",
+    "game",
+    "animals",
+    "video",
+    "music",
+]
+SNAPSHOT_CH = ["badge", "bonus", "a-board", "c-board"]
+BACKUP_CH = BACKUP_BY_DATE_CH + BACKUP_IN_ONE_FILE_CH + SNAPSHOT_CH
+# the total may be unknown, e.g. "bytes 100-199/*"
+CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+
+class RetryDownload(Exception):
+    """
+    Raised when a download is interrupted and worth another attempt.
+    """
 
 
 class Backup:
@@ -25,7 +60,12 @@ class Backup:
         self.log = Log.get("backup")
         self.backup_root = cfg["backup"]["local_folder"]
         os.makedirs(self.backup_root, exist_ok=True)
+        manifest.open(self.backup_root)
         self.exists = {}
+        self.saved_bytes = 0
+        self.mentions = MentionResolver()
+        # the message last fetched by refresh_url and its current links
+        self.refreshed = (None, [])
 
     def _resolve_path(self, *parts):
         """
@@ -52,7 +92,20 @@ class Backup:
             ext = guessed or ""
         return ext or ".bin"
 
-    async def add_attachment(self, url, attname, md_dir, att_dir):
+    def _link(self, attname, md_dir, relpath, image):
+        """
+        Format the Markdown link to an attachment, through its thumbnail when there is one.
+        """
+        if not image:
+            return f"[{attname}]({relpath})"
+        thumb = media.thumb_path(f"{os.path.splitext(relpath)[0]}.{media.format}")
+        if media.enabled and os.path.exists(self._resolve_path(md_dir, thumb)):
+            return f"[![{attname}]({thumb})]({relpath})"
+        return f"![{attname}]({relpath})"
+
+    async def add_attachment(
+        self, url, attname, md_dir, att_dir, image=False, source=(None, None)
+    ):
         """
         Add an attachment to the backup.
 
@@ -61,6 +114,8 @@ class Backup:
             attname (str): The name of the attachment.
             md_dir (str): The directory where the Markdown files are stored.
             att_dir (str): The directory where the attachments are stored.
+            image (bool, optional): Whether to link it as an image. Defaults to False.
+            source (tuple, optional): The channel and message ids it comes from, for the manifest.
 
         Returns:
             str: The Markdown link to the attachment.
@@ -69,19 +124,304 @@ class Backup:
         if abs_att_dir not in self.exists:
             os.makedirs(abs_att_dir, exist_ok=True)
             self.exists[abs_att_dir] = set(os.listdir(abs_att_dir))
-        chunk_size = cfg["backup"]["chunk_size"]
-        async with httpx_client.stream("GET", url) as r:
-            ext = self._get_extension(url, r.headers.get("content-type"))
-            filename = f"{attname}{ext}"
-            relpath = pj(att_dir, filename)
-            if filename in self.exists[abs_att_dir]:
-                return f"[{attname}]({relpath})"
-            abspath = pj(abs_att_dir, filename)
-            with open(abspath, "wb") as f:
-                async for chunk in r.aiter_bytes(chunk_size):
-                    f.write(chunk)
+        names = [f"{attname}{self._get_extension(url)}"]
+        if media.enabled:
+            names.insert(0, f"{attname}.{media.format}")
+        for existing in names:
+            if existing in self.exists[abs_att_dir]:
+                await self._adopt(pj(abs_att_dir, existing), source, url)
+                return self._link(attname, md_dir, pj(att_dir, existing), image)
+        filename = await self._fetch(url, attname, abs_att_dir, source)
+        if filename is None:
+            relpath = pj(att_dir, f"{attname}{self._get_extension(url)}")
+            manifest.expect(pj(abs_att_dir, os.path.basename(relpath)), *source, url)
+            return self._link(attname, md_dir, relpath, image)
+        relpath = pj(att_dir, filename)
+        if filename in self.exists[abs_att_dir]:
+            await self._adopt(pj(abs_att_dir, filename), source, url)
+            return self._link(attname, md_dir, relpath, image)
+        ext = os.path.splitext(filename)[1]
+        abspath = pj(abs_att_dir, filename)
+        metrics.inc("backup_attachments_total")
         self.exists[abs_att_dir].add(filename)
-        return f"[{attname}]({relpath})"
+        if media.wants(ext):
+            kept, thumb, saved = await media.process(abspath)
+            if kept != abspath:
+                if os.path.exists(abspath):
+                    # original kept next to the recompressed file
+                    await manifest.record(abspath, *source, url)
+                else:
+                    self.exists[abs_att_dir].discard(filename)
+            if thumb:
+                await manifest.record(thumb, *source)
+            filename = os.path.basename(kept)
+            relpath = pj(att_dir, filename)
+            self.exists[abs_att_dir].add(filename)
+            self.saved_bytes += saved
+            metrics.inc("backup_media_saved_bytes_total", saved)
+            abspath = kept
+        await manifest.record(abspath, *source, url)
+        return self._link(attname, md_dir, relpath, image)
+
+    async def _adopt(self, abspath, source, url):
+        """
+        Record a file that was already in the backup, if the manifest lacks it.
+
+        Files written before the manifest existed are hashed the first time a
+        backup comes across them.
+        """
+        if not manifest.has(abspath):
+            await manifest.record(abspath, *source, url)
+
+    async def _fetch(self, url, attname, abs_att_dir, source):
+        """
+        Download an attachment, refreshing its link once if the server refuses it.
+
+        Returns:
+            str: The file name of the attachment, or None if it could not be downloaded.
+        """
+        try:
+            return await self._download(url, attname, abs_att_dir)
+        except httpx.HTTPStatusError as e:
+            error = e
+        # signed CDN links expire, e.g. the ones read back from the mirror
+        fresh = await self.refresh_url(*source, url) if source[1] else None
+        if fresh is not None and fresh != url:
+            metrics.inc("backup_url_refreshed_total")
+            try:
+                return await self._download(fresh, attname, abs_att_dir)
+            except httpx.HTTPStatusError as e:
+                error = e
+        self.log.error(f"failed to download {attname}: {error}")
+        return None
+
+    @staticmethod
+    def _read_meta(meta_path, part):
+        """
+        Read the sidecar of a .part file, treating a missing or corrupt one as no meta.
+        """
+        if not (os.path.exists(meta_path) and os.path.exists(part)):
+            return {}
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return meta if isinstance(meta, dict) else {}
+
+    async def _download(self, url, attname, abs_att_dir):
+        """
+        Download an attachment through a .part file, resuming after failures.
+
+        The .part file is renamed to its final name only once its length matches
+        the one announced by the server, so an interrupted download never looks
+        complete. Transport errors, short reads, 429 and 5xx responses are retried
+        with backoff, resuming with a Range request where the server allows it.
+        The identity encoding is requested, so lengths and ranges count the bytes
+        written to the file. Nothing is downloaded when the final file exists already.
+
+        Args:
+            url (str): The URL of the attachment.
+            attname (str): The name of the attachment, without extension.
+            abs_att_dir (str): The absolute directory of the attachments.
+
+        Returns:
+            str: The file name of the attachment, or None if it could not be downloaded.
+
+        Raises:
+            httpx.HTTPStatusError: If the server refuses the download, e.g. because the link expired.
+        """
+        part = pj(abs_att_dir, f"{attname}.part")
+        meta_path = f"{part}.json"
+        retries = cfg["backup"].get("retries", 3)
+        backoff = cfg["backup"].get("backoff", 1.0)
+        chunk_size = cfg["backup"]["chunk_size"]
+        for attempt in range(retries + 1):
+            meta = self._read_meta(meta_path, part)
+            offset = os.path.getsize(part) if meta else 0
+            headers = {"Accept-Encoding": "identity"}
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
+            try:
+                async with metrics.timer("http_request_seconds", target="cdn"):
+                    async with cdn_client.stream("GET", url, headers=headers) as r:
+                        if r.status_code == 416:
+                            # the part is complete or stale, start over
+                            os.remove(part)
+                            raise RetryDownload("range not satisfiable")
+                        if r.status_code != 429 and r.status_code < 500:
+                            r.raise_for_status()
+                        else:
+                            raise RetryDownload(f"status {r.status_code}")
+                        ext = meta.get("ext") or self._get_extension(
+                            url, r.headers.get("content-type")
+                        )
+                        filename = f"{attname}{ext}"
+                        if filename in self.exists[abs_att_dir]:
+                            return filename
+                        encoded = r.headers.get("content-encoding", "identity")
+                        if r.status_code == 206:
+                            match = CONTENT_RANGE.fullmatch(
+                                r.headers.get("content-range", "").strip()
+                            )
+                            if (
+                                not match
+                                or int(match[1]) != offset
+                                or encoded != "identity"
+                            ):
+                                # not the bytes the part is missing, start over
+                                if os.path.exists(part):
+                                    os.remove(part)
+                                raise RetryDownload("unusable partial response")
+                            metrics.inc("backup_download_resumed_total")
+                            size = None if match[3] == "*" else int(match[3])
+                            mode = "ab" if offset else "wb"
+                        else:
+                            length = r.headers.get("content-length", "")
+                            # a length of the encoded body says nothing of the file
+                            size = (
+                                int(length)
+                                if length.isdigit() and encoded == "identity"
+                                else None
+                            )
+                            mode = "wb"
+                        with open(meta_path, "w", encoding="utf-8") as f:
+                            json.dump({"ext": ext, "size": size}, f)
+                        with open(part, mode) as f:
+                            async for chunk in r.aiter_bytes(chunk_size):
+                                f.write(chunk)
+                                metrics.inc("backup_bytes_total", len(chunk))
+                written = os.path.getsize(part)
+                if size is not None and written != size:
+                    raise RetryDownload(f"got {written} of {size} bytes")
+                os.replace(part, pj(abs_att_dir, filename))
+                os.remove(meta_path)
+                return filename
+            except (httpx.TransportError, RetryDownload) as e:
+                error = repr(e)
+            if attempt == retries:
+                self.log.error(
+                    f"failed to download {attname} after {attempt + 1} attempts: {error}"
+                )
+                return None
+            metrics.inc("backup_download_retries_total")
+            await asyncio.sleep(backoff * 2**attempt)
+
+    async def refresh_url(self, channel_id, message_id, url):
+        """
+        Get the current URL of an attachment whose signed CDN link has expired.
+
+        Args:
+            channel_id (int): The channel of the source message.
+            message_id (int): The source message.
+            url (str): The recorded URL.
+
+        Returns:
+            str: The current URL, or None if the message or attachment is gone.
+        """
+        if self.refreshed[0] != message_id:
+            try:
+                m = await directory.channel(channel_id).fetch_message(message_id)
+            except (discord.HTTPException, AttributeError):
+                return None
+            urls = [att.url for att in m.attachments]
+            for embed in m.embeds:
+                urls += [embed.image.url, embed.thumbnail.proxy_url]
+            # the attachments of a message are downloaded one after another
+            self.refreshed = (message_id, urls)
+        urls = self.refreshed[1]
+        path = urlparse(url).path
+        for candidate in urls:
+            if candidate and urlparse(candidate).path == path:
+                return candidate
+        return None
+
+    async def repair(self, paths):
+        """
+        Download the given attachments again, refreshing expired links.
+
+        Every replacement is downloaded, and recompressed where the backup did
+        so, under a staging name next to the broken file. It only takes the
+        place of the broken file once it is complete, so a file whose
+        replacement fails is left as it was.
+
+        Args:
+            paths (list): The paths of the files, relative to the backup root.
+
+        Returns:
+            list: The paths that could not be repaired.
+        """
+        failed = []
+        for path in paths:
+            source = manifest.source(path)
+            if source is None or source[2] is None or not await self.repair_file(
+                path, *source
+            ):
+                failed.append(path)
+        return failed
+
+    async def repair_file(self, path, channel_id, message_id, url):
+        abspath = self._resolve_path(path)
+        abs_dir, basename = os.path.split(abspath)
+        stem = os.path.splitext(basename)[0]
+        staging = f"{stem}.repair"
+        self.exists.setdefault(abs_dir, set())
+        filename = await self._fetch(url, staging, abs_dir, (channel_id, message_id))
+        if filename is None:
+            return False
+        staged = [pj(abs_dir, filename)]
+        if media.wants(os.path.splitext(filename)[1]):
+            kept, thumb, _ = await media.process(staged[0])
+            staged = [p for p in [staged[0], kept, thumb] if p and os.path.exists(p)]
+        # staging names map back to the names of the broken file and its thumbnail
+        targets = {
+            p: pj(os.path.dirname(p), os.path.basename(p).replace(staging, stem, 1))
+            for p in set(staged)
+        }
+        if abspath not in targets.values():
+            # e.g. the recompression failed and left a different format
+            for p in targets:
+                os.remove(p)
+            self.log.error(f"failed to repair {path}: got {filename}")
+            return False
+        for p, target in targets.items():
+            os.replace(p, target)
+            thumb = os.path.basename(os.path.dirname(target)) == THUMB_DIR
+            await manifest.record(
+                target, channel_id, message_id, None if thumb else url
+            )
+        return True
+
+    @staticmethod
+    def _time_str(m):
+        """
+        Format the timestamp of a message, marking edited ones.
+        """
+        if m.edited_at:
+            return m.edited_at.astimezone(tz).strftime("%y%m%d-%H%M%S") + "-EDIT"
+        return m.created_at.astimezone(tz).strftime("%y%m%d-%H%M%S")
+
+    async def iter_messages(self, channel_name, after=None, before=None):
+        """
+        Iterate the messages of a channel oldest first, from the local mirror when it covers the channel.
+
+        Args:
+            channel_name (str): The name of the Discord channel.
+            after (datetime.datetime, optional): Only messages created after it. Defaults to None.
+            before (datetime.datetime, optional): Only messages created before it. Defaults to None.
+
+        Yields:
+            discord.Message | MirroredMessage: The messages.
+        """
+        channel = directory.channel(channel_name)
+        if mirror.covers(channel.id):
+            for m in mirror.messages(channel.id, after, before):
+                yield m
+            return
+        async for m in channel.history(
+            limit=None, after=after, before=before, oldest_first=True
+        ):
+            yield m
 
     async def get_earliest_date(self, channel_name):
         """
@@ -93,7 +433,11 @@ class Backup:
         Returns:
             datetime.date: The earliest date of messages in the channel.
         """
-        channel = bot.get_channel(cfg["channel"][channel_name])
+        channel = directory.channel(channel_name)
+        if mirror.covers(channel.id):
+            earliest = mirror.earliest(channel.id)
+            if earliest:
+                return earliest.astimezone(tz).date()
         first_message = (await channel.history(limit=1, oldest_first=True).flatten())[0]
         return first_message.created_at.astimezone(tz).date()
 
@@ -107,7 +451,7 @@ class Backup:
         Returns:
             datetime.date: The latest date of messages in the channel.
         """
-        channel = bot.get_channel(cfg["channel"][channel_name])
+        channel = directory.channel(channel_name)
         latest_message = (await channel.history(limit=1).flatten())[0]
         return latest_message.created_at.astimezone(tz).date()
 
@@ -124,6 +468,8 @@ class Backup:
         Returns:
             str: The Markdown representation of the message.
         """
+        metrics.inc("backup_messages_total")
+        source = (m.channel.id, m.id)
         title = m.author.display_name + "-" + time_str
         message = []
         message.append(f"#### {title}")
@@ -147,8 +493,10 @@ class Backup:
                             f"{time_str}-{att_count}",
                             md_dir,
                             rel_att_dir,
+                            image=True,
+                            source=source,
                         )
-                        message.append(f"!{filelink}")
+                        message.append(filelink)
                         att_count += 1
                 elif embed.type == "image":
                     filelink = await self.add_attachment(
@@ -156,20 +504,24 @@ class Backup:
                         f"{time_str}-{att_count}",
                         md_dir,
                         rel_att_dir,
+                        image=True,
+                        source=source,
                     )
-                    message.append(f"!{filelink}")
+                    message.append(filelink)
                     att_count += 1
         if m.attachments:
             for att in m.attachments:
                 filelink = await self.add_attachment(
-                    att.url, f"{time_str}-{att_count}", md_dir, rel_att_dir
+                    att.url,
+                    f"{time_str}-{att_count}",
+                    md_dir,
+                    rel_att_dir,
+                    image=bool(att.content_type and "image" in att.content_type),
+                    source=source,
                 )
-                if att.content_type and "image" in att.content_type:
-                    message.append(f"!{filelink}")
-                else:
-                    message.append(filelink)
+                message.append(filelink)
                 att_count += 1
-        return "\n".join(message).replace(cfg["emoji"]["fate"], "🔮")
+        return await self.mentions.render("\n".join(message))
 
     async def snapshot(self, channel_name):
         """
@@ -183,18 +535,13 @@ class Backup:
         rel_att_dir = pj("attachments", channel_name)
         file_path = self._resolve_path(md_dir, filename)
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        channel = bot.get_channel(cfg["channel"][channel_name])
         content = []
-        async for m in channel.history(limit=None, oldest_first=True):
-            if m.edited_at:
-                dt = m.edited_at.astimezone(tz)
-                time_str = dt.strftime("%y%m%d-%H%M%S") + "-EDIT"
-            else:
-                dt = m.created_at.astimezone(tz)
-                time_str = dt.strftime("%y%m%d-%H%M%S")
+        async for m in self.iter_messages(channel_name):
+            time_str = self._time_str(m)
             content.append(await self.message_to_md(m, time_str, md_dir, rel_att_dir))
         with open(file_path, "w", encoding="utf8") as f:
             f.write("\n".join(content))
+        await manifest.record(file_path)
 
     async def get_content_by_date(
         self, channel_name, start_date, end_date, md_dir, rel_att_dir
@@ -214,17 +561,9 @@ class Backup:
         """
         start_date_min = datetime.combine(start_date, datetime.min.time())
         end_date_min = datetime.combine(end_date, datetime.min.time())
-        channel = bot.get_channel(cfg["channel"][channel_name])
         content = []
-        async for m in channel.history(
-            limit=None, after=start_date_min, before=end_date_min, oldest_first=True
-        ):
-            if m.edited_at:
-                dt = m.edited_at.astimezone(tz)
-                time_str = dt.strftime("%y%m%d-%H%M%S") + "-EDIT"
-            else:
-                dt = m.created_at.astimezone(tz)
-                time_str = dt.strftime("%y%m%d-%H%M%S")
+        async for m in self.iter_messages(channel_name, start_date_min, end_date_min):
+            time_str = self._time_str(m)
             content.append(await self.message_to_md(m, time_str, md_dir, rel_att_dir))
         return "\n".join(content)
 
@@ -258,6 +597,7 @@ class Backup:
             if needs_newline:
                 f.write("\n")
             f.write(content)
+        await manifest.record(file_path)
 
     async def backup_by_date(
         self, channel_name, start_date, end_date, md_dir, rel_att_dir, verbose=False
@@ -290,16 +630,25 @@ class Backup:
             if content:
                 with open(file_path, "w", encoding="utf8") as f:
                     f.write(content)
+                await manifest.record(file_path)
             date += timedelta(days=1)
 
 
-async def backup_by_date(message=None, channel=None, start_date=None, end_date=None):
+async def backup_by_date(
+    message=None, channel=None, start_date=None, end_date=None, progress=None
+):
     """
     Backs up different channels to local storage.
 
     Args:
         message: The message to respond.
-        start_date_str (str, optional): The start date in the format 'yymmdd'. Defaults to None.
+        channel: The channel to report to when there is no message.
+        start_date (datetime.date, optional): The start date. Defaults to the earliest message.
+        end_date (datetime.date, optional): The end date. Defaults to today.
+        progress (coroutine function, optional): Called with a text after each channel.
+
+    Returns:
+        dict: The summary of the run.
     """
     end_date = datetime.now(tz).date() if end_date is None else end_date
     start_date_str = start_date.strftime("%y%m%d") if start_date else "beginning"
@@ -311,38 +660,92 @@ async def backup_by_date(message=None, channel=None, start_date=None, end_date=N
         )
         channel = message.channel
     dbx_backup = Backup()
-    backup_by_date_ch = ["chat", "night"]
-    backup_in_one_file_ch = [
-        "record",
-        "tutorials",
-        "references",
-        "gallery",
-        "food",
-        "meme",
-        "game",
-        "animals",
-        "video",
-        "music",
-    ]
-    snapshot_ch = ["badge", "bonus", "a-board", "c-board"]
-    for ch in backup_by_date_ch:
-        start_date = (
-            await dbx_backup.get_earliest_date(ch) if start_date is None else start_date
-        )
-        await dbx_backup.backup_by_date(
-            ch, start_date, end_date, ch, "attachments", verbose=True
-        )
-    for ch in backup_in_one_file_ch:
-        start_date = (
-            await dbx_backup.get_earliest_date(ch) if start_date is None else start_date
-        )
-        await dbx_backup.backup_in_one_file(
-            ch, start_date, end_date, "", pj("attachments", ch), verbose=True
-        )
-    for ch in snapshot_ch:
-        await dbx_backup.snapshot(ch)
+    with rest.bulk():
+        async with metrics.timer("backup_stage_seconds", stage="by_date"):
+            for ch in BACKUP_BY_DATE_CH:
+                start_date = (
+                    await dbx_backup.get_earliest_date(ch)
+                    if start_date is None
+                    else start_date
+                )
+                await dbx_backup.backup_by_date(
+                    ch, start_date, end_date, ch, "attachments", verbose=True
+                )
+                if progress:
+                    await progress(f"{ch} done")
+        async with metrics.timer("backup_stage_seconds", stage="in_one_file"):
+            for ch in BACKUP_IN_ONE_FILE_CH:
+                start_date = (
+                    await dbx_backup.get_earliest_date(ch)
+                    if start_date is None
+                    else start_date
+                )
+                await dbx_backup.backup_in_one_file(
+                    ch, start_date, end_date, "", pj("attachments", ch), verbose=True
+                )
+                if progress:
+                    await progress(f"{ch} done")
+        async with metrics.timer("backup_stage_seconds", stage="snapshot"):
+            for ch in SNAPSHOT_CH:
+                await dbx_backup.snapshot(ch)
+                if progress:
+                    await progress(f"{ch} done")
+    media.close()
+    summary = {"saved_bytes": dbx_backup.saved_bytes}
+    if media.enabled:
+        dbx_backup.log.info(f"media recompression saved {dbx_backup.saved_bytes} bytes")
+    if channel is None:
+        return summary
     await channel.send(
         embed=discord.Embed(
-            title=f"Backup from {start_date_str} to {end_date.strftime('%y%m%d')} finished"
+            title=f"Backup from {start_date_str} to {end_date.strftime('%y%m%d')} finished",
+            description=format_summary(summary),
         )
     )
+    return summary
+
+
+def format_summary(summary):
+    """
+    Describe the summary of a backup run for the finished message.
+
+    Args:
+        summary (dict): The summary returned by backup_by_date.
+
+    Returns:
+        str: The description, or None when there is nothing to report.
+    """
+    if not media.enabled:
+        return None
+    return f"Media recompression saved {summary['saved_bytes'] / 2**20:.1f} MiB"
+
+
+async def verify(message, repair=True, adopt=False):
+    """
+    Verify the backup folder against the manifest and download broken attachments again.
+
+    Args:
+        message (discord.Message): The message triggering the verification.
+        repair (bool, optional): Whether to download broken attachments again. Defaults to True.
+        adopt (bool, optional): Whether to record the orphaned files as they are. Defaults to False.
+    """
+    await message.respond(embed=discord.Embed(description="Verifying the backup folder"))
+    dbx_backup = Backup()
+    report = await manifest.verify(cfg["backup"].get("verify_workers"))
+    broken = report["missing"] + report["truncated"] + report["corrupted"]
+    failed = broken
+    if repair and broken:
+        with rest.bulk():
+            failed = await dbx_backup.repair(broken)
+    lines = [f"{problem}: {len(paths)}" for problem, paths in report.items()]
+    if repair and broken:
+        lines.append(f"repaired: {len(broken) - len(failed)}")
+    if adopt and report["orphaned"]:
+        await manifest.adopt(report["orphaned"])
+        lines.append(f"adopted: {len(report['orphaned'])}")
+    lines += [f"- {path}" for path in failed[:20]]
+    if len(failed) > 20:
+        lines.append(f"… {len(failed) - 20} more")
+    await message.channel.send(
+        embed=discord.Embed(title="**Backup verified**", description="\n".join(lines))
+    )
@@ -0,0 +1,123 @@
+"""
+contains the index of badge messages
+"""
+
+import re
+import asyncio
+import discord
+from src.core.init import Log
+from src.core.rest import rest
+from src.core.tools import MAX_EMBEDS, MAX_EMBED_CHARS
+
+# user id inside avatar urls, e.g. /avatars/<id>/<hash>.png or /users/<id>/avatars/
+AVATAR_ID = re.compile(r"/(?:avatars|users)/(\d+)/")
+
+
+class BadgeIndex:
+    """
+    Index from badge owner id to the message holding the owner's latest badges.
+
+    The index is built once from the channel history and kept current by every award,
+    so an award costs one fetch and one edit regardless of the channel size. A badge
+    rolls over to a new message once the indexed one would exceed the embed count or
+    the total embed length allowed in a message.
+    """
+
+    def __init__(self):
+        """
+        Initialize the BadgeIndex object.
+        """
+        self.log = Log.get("badge")
+        # owner id -> [message id, embed count, total embed length]
+        self.owners = {}
+        self.built = False
+        self.lock = asyncio.Lock()
+
+    @staticmethod
+    def fits(embeds, embed):
+        """
+        Check whether an embed can be added to a message holding the given embeds.
+
+        Args:
+            embeds (list): The embeds of the message.
+            embed (discord.Embed): The embed to add.
+
+        Returns:
+            bool: True if the message stays within the Discord limits.
+        """
+        return (
+            len(embeds) < MAX_EMBEDS
+            and sum(len(e) for e in embeds) + len(embed) <= MAX_EMBED_CHARS
+        )
+
+    @staticmethod
+    def owner_of(embed):
+        """
+        Get the owner id of a badge embed from its footer icon.
+
+        Args:
+            embed (discord.Embed): The badge embed.
+
+        Returns:
+            int: The owner id, or None if it cannot be identified.
+        """
+        icon_url = embed.footer.icon_url if embed.footer else None
+        match = AVATAR_ID.search(str(icon_url or ""))
+        return int(match.group(1)) if match else None
+
+    async def build(self, channel):
+        """
+        Build the index from the channel history.
+
+        Args:
+            channel (discord.TextChannel): The badge channel.
+        """
+        self.owners = {}
+        with rest.bulk():
+            async for m in channel.history(limit=None):
+                if not m.embeds:
+                    continue
+                owner_id = self.owner_of(m.embeds[0])
+                if owner_id is not None and owner_id not in self.owners:
+                    self.owners[owner_id] = [
+                        m.id,
+                        len(m.embeds),
+                        sum(len(e) for e in m.embeds),
+                    ]
+        self.built = True
+        self.log.info(f"indexed badges of {len(self.owners)} owners")
+
+    async def add(self, channel, owner_id, embed):
+        """
+        Append a badge to the owner's message, rolling over to a new message when it is full.
+
+        Args:
+            channel (discord.TextChannel): The badge channel.
+            owner_id (int): The id of the badge owner.
+            embed (discord.Embed): The badge embed.
+        """
+        async with self.lock:
+            if not self.built:
+                await self.build(channel)
+            entry = self.owners.get(owner_id)
+            if (
+                entry
+                and entry[1] < MAX_EMBEDS
+                and entry[2] + len(embed) <= MAX_EMBED_CHARS
+            ):
+                try:
+                    aim_message = await channel.fetch_message(entry[0])
+                except discord.NotFound:
+                    aim_message = None
+                if aim_message and self.fits(aim_message.embeds, embed):
+                    embeds = aim_message.embeds
+                    embeds.append(embed)
+                    await aim_message.edit(embeds=embeds)
+                    entry[1] = len(embeds)
+                    entry[2] = sum(len(e) for e in embeds)
+                    return
+            new_message = await channel.send(embed=embed)
+            self.owners[owner_id] = [new_message.id, 1, len(embed)]
+
+
+badge_index = BadgeIndex()
@@ -0,0 +1,91 @@
+"""
+contains the state of multi-step interactive commands
+"""
+
+import asyncio
+from discord.ui import View
+from src.core.init import Log
+
+# seconds to wait for each step of a conversation
+STEP_TIMEOUT = 120
+
+
+class Conversations:
+    """
+    Registry of pending conversation steps.
+
+    Replies are routed by (user id, channel id) with at most two dict lookups per
+    message instead of running a check callback of every waiter, and every step
+    expires. A step asked without a user is answered by the next message of anyone
+    in the channel, as the bot's own messages never reach dispatch(); a step waiting
+    for that particular user takes precedence.
+    """
+
+    def __init__(self):
+        """
+        Initialize the Conversations object.
+        """
+        self.log = Log.get("conversation")
+        self.waiters = {}
+
+    async def ask(self, channel, user=None, timeout=STEP_TIMEOUT):
+        """
+        Wait for the next message in a channel.
+
+        Args:
+            channel (discord.abc.Messageable): The channel to wait in.
+            user (discord.abc.User, optional): Only accept a reply from this user. Defaults to anyone.
+            timeout (float, optional): Seconds to wait. Defaults to STEP_TIMEOUT.
+
+        Returns:
+            discord.Message: The reply, or None if the step expired or was superseded.
+        """
+        key = (user.id if user else None, channel.id)
+        previous = self.waiters.get(key)
+        if previous and not previous.done():
+            previous.set_result(None)
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[key] = future
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.log.info(f"conversation of {user or 'anyone'} in {channel} expired")
+            return None
+        finally:
+            if self.waiters.get(key) is future:
+                del self.waiters[key]
+
+    def dispatch(self, message):
+        """
+        Route a message to the conversation waiting for it.
+
+        Args:
+            message (discord.Message): The incoming message.
+
+        Returns:
+            bool: Whether the message was consumed by a conversation.
+        """
+        for key in [(message.author.id, message.channel.id), (None, message.channel.id)]:
+            future = self.waiters.pop(key, None)
+            if future is not None and not future.done():
+                future.set_result(message)
+                return True
+        return False
+
+
+class ConversationView(View):
+    """
+    View that removes itself from the message when the step expires.
+    """
+
+    def __init__(self, *items, timeout=STEP_TIMEOUT):
+        super().__init__(*items, timeout=timeout)
+
+    async def on_timeout(self):
+        if self.message:
+            await self.message.edit(content="已超时", view=None)
+        elif self.parent:
+            await self.parent.edit_original_response(content="已超时", view=None)
+
+
+conversations = Conversations()
@@ -1,5 +1,12 @@
+import io
 import random
-from src.core.init import cfg, bot
+import asyncio
+from src.core.init import cfg, bot, Log
+
+AVATAR_DIR = "./src/assets/avatars"
+# Discord accepts avatars up to 10MB and displays them at most 1024x1024
+AVATAR_SIZE = 1024
+AVATAR_MAX_BYTES = 10 * 1024 * 1024
 
 
 class Cortana:
@@ -8,19 +15,115 @@ class Cortana:
     """
 
     def __init__(self):
+        self.log = Log.get("cortana")
         self.member = None
         self.name = None
         self.display_name = None
         self.color = None
+        self.role_id = None
+        self.avatars = {}
 
     def init(self):
-        self.member = bot.get_guild(cfg["guild_id"]).me
+        if not self.avatars:
+            self.load_avatars()
+        guild = bot.get_guild(cfg["guild_id"])
+        self.member = guild.me
         self.display_name = self.member.display_name
         for name in cfg["cortana"]:
             if self.member.display_name == cfg["cortana"][name]["display_name"]:
                 self.name = name
                 self.color = cfg["cortana"][name]["color"]
                 break
+        for role in self.member.roles:
+            if role.name == "Cortana":
+                self.role_id = role.id
+                break
+
+    def load_avatars(self):
+        """
+        Loads the avatars of all identities into memory, fitted to Discord's limits.
+
+        Raises:
+            ValueError: If an avatar is still too large after recompression.
+        """
+        for name in cfg["cortana"]:
+            self.avatars[name] = self.load_avatar(name)
+        self.log.info(f"loaded {len(self.avatars)} avatars")
+
+    def load_avatar(self, name):
+        """
+        Loads the avatar of an identity, fitted to Discord's limits.
+
+        Args:
+            name (str): The name of the identity.
+
+        Returns:
+            bytes: The avatar.
+
+        Raises:
+            ValueError: If the avatar is still too large after recompression.
+        """
+        with open(f"{AVATAR_DIR}/{name.lower()}.jpg", "rb") as fp:
+            avatar = self.fit_avatar(fp.read())
+        if len(avatar) > AVATAR_MAX_BYTES:
+            raise ValueError(f"avatar of {name} exceeds {AVATAR_MAX_BYTES} bytes")
+        return avatar
+
+    async def edit_avatar(self, name):
+        # identities added by a config reload are loaded on first use
+        if name not in self.avatars:
+            self.avatars[name] = await asyncio.to_thread(self.load_avatar, name)
+        await bot.user.edit(avatar=self.avatars[name])
+
+    @staticmethod
+    def fit_avatar(data):
+        """
+        Resizes and recompresses an avatar when Pillow is available.
+
+        Args:
+            data (bytes): The original image.
+
+        Returns:
+            bytes: The fitted JPEG image, or the original one without Pillow.
+        """
+        try:
+            from PIL import Image
+        except ImportError:
+            return data
+        with Image.open(io.BytesIO(data)) as img:
+            if max(img.size) <= AVATAR_SIZE and len(data) <= AVATAR_MAX_BYTES:
+                return data
+            img = img.convert("RGB")
+            img.thumbnail((AVATAR_SIZE, AVATAR_SIZE))
+            buffer = io.BytesIO()
+            img.save(buffer, format="JPEG", quality=90, optimize=True)
+        return buffer.getvalue()
+
+    async def apply(self, name, parts=("avatar", "nick", "role")):
+        """
+        Applies the avatar, nickname and role colour of an identity concurrently.
+
+        Args:
+            name (str): The name of the identity to apply.
+            parts (tuple, optional): The parts to apply. Defaults to all of them.
+
+        Returns:
+            dict: The exceptions of the failed parts, keyed by part.
+        """
+        edits = {}
+        if "avatar" in parts:
+            edits["avatar"] = self.edit_avatar(name)
+        if "nick" in parts:
+            edits["nick"] = self.member.edit(nick=cfg["cortana"][name]["display_name"])
+        role = self.member.guild.get_role(self.role_id) if self.role_id else None
+        if "role" in parts and role:
+            edits["role"] = role.edit(colour=cfg["cortana"][name]["color"])
+        results = await asyncio.gather(*edits.values(), return_exceptions=True)
+        return {
+            part: result
+            for part, result in zip(edits, results)
+            if isinstance(result, Exception)
+        }
 
     async def shift(self, name):
         """
@@ -28,17 +131,22 @@ class Cortana:
 
         Args:
             name (str): The name of the identity to shift to.
+
+        Raises:
+            RuntimeError: If any part of the shift failed; the applied parts are rolled back.
         """
+        failed = await self.apply(name)
+        if failed:
+            self.log.error(f"shift to {name} failed: {failed}")
+            applied = tuple(p for p in ("avatar", "nick", "role") if p not in failed)
+            if self.name and applied:
+                rollback_failed = await self.apply(self.name, applied)
+                if rollback_failed:
+                    self.log.error(f"rollback to {self.name} failed: {rollback_failed}")
+            raise RuntimeError(f"shift to {name} failed: {next(iter(failed.values()))}")
         self.name = name
         self.display_name = cfg["cortana"][name]["display_name"]
         self.color = cfg["cortana"][name]["color"]
-        with open(f"./src/assets/avatars/{self.name.lower()}.jpg", "rb") as fp:
-            await bot.user.edit(avatar=fp.read())
-        await self.member.edit(nick=self.display_name)
-        for role in self.member.roles:
-            if role.name == "Cortana":
-                await role.edit(colour=self.color)
-                break
 
     async def random_change(self):
         """
@@ -0,0 +1,264 @@
+"""
+contains the index of recently archived attachments, for spotting repeats
+"""
+
+import io
+import os
+import json
+import asyncio
+import hashlib
+from collections import OrderedDict
+from src.core.init import cfg, cdn_client, Log
+from src.core.metrics import metrics
+
+# side of the thumbnail requested from the media proxy for perceptual hashes
+THUMB_SIZE = 64
+HASH_SIZE = 8
+# perceptual hashes within BANDS - 1 bits agree on at least one band exactly
+BANDS = 4
+BAND_BITS = HASH_SIZE * HASH_SIZE // BANDS
+
+
+def dhash(data):
+    """
+    Compute the difference hash of an image.
+
+    Args:
+        data (bytes): The image.
+
+    Returns:
+        int: The 64-bit hash.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        pixels = list(img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE)).getdata())
+    bits = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            bits = bits << 1 | (left > pixels[row * (HASH_SIZE + 1) + col + 1])
+    return bits
+
+
+class ArchiveIndex:
+    """
+    Bounded index of the attachments archived recently, persisted to a JSON file.
+
+    An image is matched by a perceptual hash of a small thumbnail from the
+    media proxy, against every entry through an index of hash bands, so
+    recompressed or resized copies are caught. A perceptual match of the same
+    size is only a repeat once SHA-256 confirms it, and anything of the same
+    size as an archived attachment is matched by SHA-256, where the full file
+    is downloaded. The whole check is bounded by a timeout and fails open,
+    archiving the attachment. The hashes of a new entry are computed in the
+    background, after the message has been archived. The oldest entries are
+    evicted beyond the capacity.
+    """
+
+    def __init__(self):
+        """
+        Initialize the ArchiveIndex object.
+        """
+        self.log = Log.get("dedup")
+        self.entries = None
+        self.by_size = {}
+        # entry ids by (band, bits of the perceptual hash in that band)
+        self.by_band = {}
+        # background content hashes, by attachment id
+        self.pending = {}
+        self.pillow = None
+        self.saving = asyncio.Lock()
+
+    @property
+    def options(self):
+        return cfg.get("dedup", {})
+
+    @property
+    def enabled(self):
+        return self.options.get("enabled", False)
+
+    @property
+    def emoji(self):
+        return self.options.get("emoji", "♻️")
+
+    def load(self):
+        """
+        Load the index file, once.
+        """
+        if self.entries is not None:
+            return
+        self.entries = OrderedDict()
+        try:
+            path = self.options.get("path", "./archive_index.json")
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = []
+        for entry in entries:
+            self.insert(entry)
+
+    def save(self, entries):
+        path = self.options.get("path", "./archive_index.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def bands(phash):
+        mask = (1 << BAND_BITS) - 1
+        return [(band, phash >> (band * BAND_BITS) & mask) for band in range(BANDS)]
+
+    def index(self, entry):
+        for key in self.bands(entry["phash"]):
+            self.by_band.setdefault(key, set()).add(entry["id"])
+
+    def insert(self, entry):
+        self.entries[entry["id"]] = entry
+        self.by_size.setdefault(entry["size"], set()).add(entry["id"])
+        if entry["phash"] is not None:
+            self.index(entry)
+        while len(self.entries) > self.options.get("capacity", 5000):
+            _, old = self.entries.popitem(last=False)
+            buckets = [(self.by_size, old["size"])]
+            if old["phash"] is not None:
+                buckets += [(self.by_band, key) for key in self.bands(old["phash"])]
+            for table, key in buckets:
+                table[key].discard(old["id"])
+                if not table[key]:
+                    del table[key]
+
+    async def perceptual_hash(self, att):
+        if not (att.content_type and att.content_type.startswith("image")):
+            return None
+        if self.pillow is None:
+            try:
+                import PIL  # noqa: F401
+
+                self.pillow = True
+            except ImportError:
+                self.pillow = False
+        if not self.pillow:
+            return None
+        separator = "&" if "?" in att.proxy_url else "?"
+        url = f"{att.proxy_url}{separator}width={THUMB_SIZE}&height={THUMB_SIZE}"
+        try:
+            r = await cdn_client.request("GET", url)
+            r.raise_for_status()
+            return await asyncio.to_thread(dhash, r.content)
+        except Exception as e:
+            self.log.warning(f"no perceptual hash for {att.url}: {e}")
+            return None
+
+    @staticmethod
+    async def content_hash(url):
+        digest = hashlib.sha256()
+        async with cdn_client.stream("GET", url) as r:
+            r.raise_for_status()
+            async for chunk in r.aiter_bytes(cfg["backup"]["chunk_size"]):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def match_perceptual(self, phash):
+        """
+        Find the entries whose perceptual hash is within the threshold.
+
+        Args:
+            phash (int): The perceptual hash.
+
+        Returns:
+            list: The entries, in no particular order.
+        """
+        threshold = min(self.options.get("threshold", 2), BANDS - 1)
+        ids = set()
+        for key in self.bands(phash):
+            ids |= self.by_band.get(key, set())
+        return [
+            self.entries[i]
+            for i in ids
+            if (self.entries[i]["phash"] ^ phash).bit_count() <= threshold
+        ]
+
+    async def lookup(self, att, fingerprint):
+        fingerprint["phash"] = await self.perceptual_hash(att)
+        if fingerprint["phash"] is not None:
+            for entry in self.match_perceptual(fingerprint["phash"]):
+                # a copy of another size was re-encoded; one of the same size
+                # is confirmed by its content below
+                if entry["size"] != att.size:
+                    return entry
+        same = [self.entries[i] for i in self.by_size.get(att.size, ())]
+        if not same:
+            return None
+        hashing = [self.pending[c["id"]] for c in same if c["id"] in self.pending]
+        if hashing:
+            # not gathered, so a timeout leaves the background hashes running
+            await asyncio.wait(hashing)
+        try:
+            fingerprint["sha256"] = await self.content_hash(att.url)
+        except Exception as e:
+            self.log.warning(f"no content hash for {att.url}: {e}")
+            return None
+        for candidate in same:
+            if candidate["sha256"] == fingerprint["sha256"]:
+                return candidate
+        return None
+
+    async def check(self, att):
+        """
+        Look for an archived copy of an attachment.
+
+        Args:
+            att (discord.Attachment): The attachment.
+
+        Returns:
+            tuple: The matching entry or None, and the fingerprint to add it with.
+        """
+        self.load()
+        fingerprint = {"phash": None, "sha256": None}
+        try:
+            entry = await asyncio.wait_for(
+                self.lookup(att, fingerprint), self.options.get("timeout", 2.0)
+            )
+        except asyncio.TimeoutError:
+            self.log.warning(f"dedup check of {att.url} timed out, archiving it")
+            metrics.inc("archive_dedup_timeouts_total")
+            entry = None
+        if entry is not None:
+            self.entries.move_to_end(entry["id"])
+            metrics.inc("archive_repeats_total")
+        return entry, fingerprint
+
+    def add(self, att, fingerprint, channel):
+        """
+        Add an archived attachment, hashing its content in the background if needed.
+
+        Args:
+            att (discord.Attachment): The attachment.
+            fingerprint (dict): The fingerprint returned by check().
+            channel (str | int): The archive channel.
+        """
+        entry = dict(fingerprint, id=att.id, size=att.size, channel=channel)
+        self.insert(entry)
+        metrics.set("archive_index_entries", len(self.entries))
+        task = asyncio.create_task(self.complete(entry, att))
+        self.pending[att.id] = task
+        task.add_done_callback(lambda _: self.pending.pop(att.id, None))
+
+    async def complete(self, entry, att):
+        if entry["phash"] is None:
+            entry["phash"] = await self.perceptual_hash(att)
+            if entry["phash"] is not None and entry["id"] in self.entries:
+                self.index(entry)
+        if entry["sha256"] is None:
+            try:
+                entry["sha256"] = await self.content_hash(att.url)
+            except Exception as e:
+                self.log.warning(f"no content hash for {att.url}: {e}")
+        entries = [dict(entry) for entry in self.entries.values()]
+        async with self.saving:
+            await asyncio.to_thread(self.save, entries)
+
+
+archive_index = ArchiveIndex()
@@ -0,0 +1,217 @@
+"""
+contains the directory of guild channels and members
+"""
+
+import discord
+from src.core.init import cfg, bot, Log
+
+
+class Directory:
+    """
+    Id and name maps of the guild's text channels and members.
+
+    The maps are built once when the bot is first ready, not again on
+    reconnects, and then kept current by the channel and member events, so
+    lookups never miss channels created later.
+    Channel and member references in the config may be either names or ids.
+    """
+
+    def __init__(self):
+        """
+        Initialize the Directory object.
+        """
+        self.log = Log.get("directory")
+        self.channel_ids = {}
+        self.channel_names = {}
+        self.member_ids = {}
+        self.member_names = {}
+        # members fetched lazily, by id
+        self.members = {}
+        # channels fetched through the API, by id
+        self.fetched = {}
+        self.built = False
+
+    def attach(self):
+        """
+        Register the event listeners that keep the maps current.
+        """
+        for listener in [
+            self.on_guild_channel_create,
+            self.on_guild_channel_delete,
+            self.on_guild_channel_update,
+            self.on_member_join,
+            self.on_member_remove,
+            self.on_member_update,
+            self.on_user_update,
+        ]:
+            bot.add_listener(listener, listener.__name__)
+
+    def build(self):
+        """
+        Build the maps from the guild cache, once.
+        """
+        if self.built:
+            return
+        guild = bot.get_guild(cfg["guild_id"])
+        self.channel_ids.clear()
+        self.channel_names.clear()
+        self.member_ids.clear()
+        self.member_names.clear()
+        self.members.clear()
+        for ch in guild.text_channels:
+            self.add_channel(ch)
+        for m in guild.members:
+            self.add_member(m)
+        # keep the legacy views of the config current
+        cfg["channel"] = self.channel_ids
+        cfg["member"] = self.member_ids
+        self.built = True
+        self.log.info(
+            f"indexed {len(self.channel_ids)} channels and {len(self.member_ids)} members"
+        )
+
+    def channel_id(self, ref):
+        """
+        Resolve a channel reference.
+
+        Args:
+            ref (int | str): The id or name of the channel.
+
+        Returns:
+            int: The channel id.
+        """
+        return ref if isinstance(ref, int) else self.channel_ids[ref]
+
+    def channel(self, ref):
+        """
+        Get a channel by reference.
+
+        Args:
+            ref (int | str): The id or name of the channel.
+
+        Returns:
+            discord.TextChannel: The channel.
+        """
+        channel_id = self.channel_id(ref)
+        return bot.get_channel(channel_id) or self.fetched.get(channel_id)
+
+    async def fetch_channels(self, refs):
+        """
+        Fetch channels through the API for processes without a gateway cache.
+
+        Args:
+            refs (list): The ids or names of the channels.
+        """
+        for ref in refs:
+            channel_id = self.channel_id(ref)
+            if channel_id not in self.fetched:
+                self.fetched[channel_id] = await bot.fetch_channel(channel_id)
+
+    def member_id(self, ref):
+        """
+        Resolve a member reference.
+
+        Without the members intent only the members seen so far are cached,
+        so names fall back to the ids configured in cfg["user"].
+
+        Args:
+            ref (int | str): The id or name of the member.
+
+        Returns:
+            int: The member id.
+        """
+        if isinstance(ref, int):
+            return ref
+        if ref in self.member_ids:
+            return self.member_ids[ref]
+        return cfg["user"][ref]
+
+    async def fetch_member(self, ref):
+        """
+        Get a member by reference, fetching and caching it when it is not cached.
+
+        Args:
+            ref (int | str): The id or name of the member.
+
+        Returns:
+            discord.Member: The member.
+        """
+        guild = bot.get_guild(cfg["guild_id"])
+        try:
+            member_id = self.member_id(ref)
+        except KeyError:
+            found = await guild.query_members(query=ref, limit=1)
+            if not found:
+                raise
+            member_id = found[0].id
+        if member_id in self.members:
+            return self.members[member_id]
+        member = guild.get_member(member_id) or await guild.fetch_member(member_id)
+        self.members[member_id] = member
+        self.add_member(member)
+        return member
+
+    def add_channel(self, ch):
+        self.channel_ids[ch.name] = ch.id
+        self.channel_names[ch.id] = ch.name
+
+    def remove_channel(self, ch):
+        name = self.channel_names.pop(ch.id, None)
+        if name is not None and self.channel_ids.get(name) == ch.id:
+            del self.channel_ids[name]
+
+    def add_member(self, m):
+        self.member_ids[m.name] = m.id
+        self.member_names[m.id] = m.name
+
+    def remove_member(self, m):
+        self.members.pop(m.id, None)
+        name = self.member_names.pop(m.id, None)
+        if name is not None and self.member_ids.get(name) == m.id:
+            del self.member_ids[name]
+
+    @staticmethod
+    def tracked(obj):
+        return obj.guild.id == cfg["guild_id"]
+
+    async def on_guild_channel_create(self, ch):
+        if self.tracked(ch) and isinstance(ch, discord.TextChannel):
+            self.add_channel(ch)
+
+    async def on_guild_channel_delete(self, ch):
+        if self.tracked(ch):
+            self.remove_channel(ch)
+
+    async def on_guild_channel_update(self, before, after):
+        if self.tracked(after) and isinstance(after, discord.TextChannel):
+            self.remove_channel(before)
+            self.add_channel(after)
+
+    async def on_member_join(self, m):
+        if self.tracked(m):
+            self.add_member(m)
+
+    async def on_member_remove(self, m):
+        if self.tracked(m):
+            self.remove_member(m)
+
+    async def on_member_update(self, before, after):
+        if not self.tracked(after):
+            return
+        cached = after.id in self.members
+        if before.name != after.name:
+            self.remove_member(before)
+            self.add_member(after)
+        if cached:
+            # nick and avatar changes reach the fetched member too
+            self.members[after.id] = after
+
+    async def on_user_update(self, before, after):
+        # a user is not a member: fetched again on next use
+        self.members.pop(after.id, None)
+        if after.id in self.member_names and before.name != after.name:
+            self.remove_member(before)
+            self.add_member(after)
+
+
+directory = Directory()
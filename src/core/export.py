@@ -0,0 +1,242 @@
+"""
+contains the export of a channel's history as a zip uploaded to Discord
+"""
+
+import io
+import zipfile
+from os.path import join as pj
+from datetime import datetime, timedelta
+import discord
+import httpx
+from src.core.init import cfg, cdn_client, tz, Log
+from src.core.backup import Backup
+from src.core.mentions import MentionResolver
+from src.core.metrics import metrics
+from src.core.rest import rest
+
+# room left in every upload for the multipart envelope
+UPLOAD_MARGIN = 2**16
+# upload limit of a guild without boosts
+DEFAULT_UPLOAD_LIMIT = 10 * 2**20
+
+
+class PartWriter(io.RawIOBase):
+    """
+    Unseekable sink for a zip stream that cuts it into parts of a fixed size.
+
+    At most one part plus one write is held in memory. Full parts are taken by
+    the caller between writes and uploaded. Joined in order they form the zip.
+    """
+
+    def __init__(self, part_size):
+        """
+        Initialize the PartWriter object.
+
+        Args:
+            part_size (int): The size of every part but the last, in bytes.
+        """
+        super().__init__()
+        self.part_size = part_size
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def full_parts(self):
+        """
+        Take the parts that are complete.
+
+        Returns:
+            list: The parts, as bytes.
+        """
+        parts = []
+        while len(self.buffer) >= self.part_size:
+            parts.append(bytes(self.buffer[: self.part_size]))
+            del self.buffer[: self.part_size]
+        return parts
+
+    def rest(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+class ZipExport(Backup):
+    """
+    Backup of a date range streamed into a zip instead of the backup folder.
+
+    Messages are rendered with Backup's Markdown logic into one file per day.
+    Attachments are streamed from the CDN straight into the zip, and the zip is
+    uploaded in parts as it grows, so only one part is ever kept in memory.
+    """
+
+    def __init__(self, target, part_size):
+        """
+        Initialize the ZipExport object.
+
+        Args:
+            target (discord.TextChannel): The channel to upload the parts to.
+            part_size (int): The max size of one upload, in bytes.
+        """
+        # only the rendering state of Backup: no backup folder, no manifest
+        self.log = Log.get("export")
+        self.mentions = MentionResolver()
+        self.refreshed = (None, [])
+        self.target = target
+        self.writer = PartWriter(part_size)
+        self.zip = zipfile.ZipFile(self.writer, "w", zipfile.ZIP_DEFLATED)
+        self.name = None
+        self.sent = 0
+
+    async def flush(self):
+        for part in self.writer.full_parts():
+            await self.upload(part, f"{self.name}.zip.{self.sent + 1:03d}")
+
+    async def upload(self, data, filename):
+        await self.target.send(file=discord.File(io.BytesIO(data), filename=filename))
+        self.sent += 1
+
+    async def add_attachment(
+        self, url, attname, md_dir, att_dir, image=False, source=(None, None)
+    ):
+        """
+        Stream an attachment into the zip.
+
+        An expired link is refreshed from the source message once. When the
+        attachment cannot be downloaded, the link is written without the file,
+        as Backup does.
+
+        Args:
+            url (str): The URL of the attachment.
+            attname (str): The name of the attachment.
+            md_dir (str): The directory of the Markdown files in the zip.
+            att_dir (str): The directory of the attachments, relative to md_dir.
+            image (bool, optional): Whether to link it as an image. Defaults to False.
+            source (tuple, optional): The channel and message ids it comes from.
+
+        Returns:
+            str: The Markdown link to the attachment.
+        """
+        try:
+            relpath = await self.stream(url, attname, md_dir, att_dir)
+        except httpx.HTTPStatusError as e:
+            relpath = None
+            error = e
+            fresh = await self.refresh_url(*source, url) if source[1] else None
+            if fresh is not None and fresh != url:
+                try:
+                    relpath = await self.stream(fresh, attname, md_dir, att_dir)
+                except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                    error = e
+        except httpx.TransportError as e:
+            relpath = None
+            error = e
+        if relpath is None:
+            self.log.error(f"failed to export {attname}: {error}")
+            relpath = pj(att_dir, f"{attname}{self._get_extension(url)}")
+        return f"![{attname}]({relpath})" if image else f"[{attname}]({relpath})"
+
+    async def stream(self, url, attname, md_dir, att_dir):
+        """
+        Stream one download into a zip entry.
+
+        The status is checked before the entry is opened, so a refused download
+        leaves nothing in the zip. A transport error past that point leaves the
+        entry truncated, as the zip cannot be rewound.
+
+        Returns:
+            str: The path of the entry, relative to md_dir.
+
+        Raises:
+            httpx.HTTPStatusError: If the server refuses the download.
+            httpx.TransportError: If the connection fails.
+        """
+        chunk_size = cfg["backup"]["chunk_size"]
+        async with metrics.timer("http_request_seconds", target="cdn"):
+            async with cdn_client.stream("GET", url) as r:
+                r.raise_for_status()
+                ext = self._get_extension(url, r.headers.get("content-type"))
+                relpath = pj(att_dir, f"{attname}{ext}")
+                with self.zip.open(pj(md_dir, relpath), "w") as f:
+                    async for chunk in r.aiter_bytes(chunk_size):
+                        f.write(chunk)
+                        await self.flush()
+        return relpath
+
+    async def add_day(self, md_dir, day, content):
+        self.zip.writestr(pj(md_dir, f"{day.strftime('%y%m%d')}.md"), "\n".join(content))
+        await self.flush()
+
+    async def run(self, channel_name, start_date, end_date):
+        """
+        Export the messages of a channel between two dates.
+
+        Args:
+            channel_name (str): The name of the Discord channel.
+            start_date (datetime.date): The first day of the export.
+            end_date (datetime.date): The day after the last one of the export.
+
+        Returns:
+            int: The number of parts uploaded.
+        """
+        self.name = (
+            f"{channel_name}-{start_date.strftime('%y%m%d')}-{end_date.strftime('%y%m%d')}"
+        )
+        after = datetime.combine(start_date, datetime.min.time(), tzinfo=tz)
+        before = datetime.combine(end_date, datetime.min.time(), tzinfo=tz)
+        day = None
+        content = []
+        with rest.bulk():
+            async for m in self.iter_messages(channel_name, after, before):
+                created = m.created_at.astimezone(tz).date()
+                if created != day:
+                    if content:
+                        await self.add_day(channel_name, day, content)
+                    day, content = created, []
+                content.append(
+                    await self.message_to_md(
+                        m, self._time_str(m), channel_name, "attachments"
+                    )
+                )
+            if content:
+                await self.add_day(channel_name, day, content)
+            self.zip.close()
+            await self.flush()
+            last = self.writer.rest()
+            if self.sent == 0:
+                await self.upload(last, f"{self.name}.zip")
+            elif last:
+                await self.upload(last, f"{self.name}.zip.{self.sent + 1:03d}")
+        return self.sent
+
+
+async def export(message, channel, start_date, end_date=None):
+    """
+    Export a date range of a channel as a zip, split at the upload limit.
+
+    Args:
+        message (discord.Message): The message triggering the export.
+        channel (discord.TextChannel): The channel to export.
+        start_date (datetime.date): The first day of the export.
+        end_date (datetime.date, optional): The day after the last one. Defaults to tomorrow.
+    """
+    end_date = end_date or datetime.now(tz).date() + timedelta(days=1)
+    await message.respond(
+        embed=discord.Embed(
+            description=f"Exporting #{channel.name} from {start_date.strftime('%y%m%d')} to {end_date.strftime('%y%m%d')}"
+        )
+    )
+    guild = message.guild
+    limit = guild.filesize_limit if guild else DEFAULT_UPLOAD_LIMIT
+    exporter = ZipExport(message.channel, limit - UPLOAD_MARGIN)
+    parts = await exporter.run(channel.name, start_date, end_date)
+    if parts > 1:
+        await message.channel.send(
+            embed=discord.Embed(
+                description=f"Export sent in {parts} parts, join them with `cat {exporter.name}.zip.* > {exporter.name}.zip`"
+            )
+        )
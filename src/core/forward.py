@@ -0,0 +1,135 @@
+"""
+contains the engine for forwarding messages between channels
+"""
+
+import asyncio
+import time
+import discord
+from src.core.init import bot, Log
+from src.core.rest import rest
+from src.core.tools import MAX_EMBEDS, MAX_EMBED_CHARS
+
+
+class Forwarder:
+    """
+    Pipelined message forwarder.
+
+    A producer pages the source channel history and converts every message into
+    embeds or plain contents, while a consumer packs the embeds into as few
+    messages as Discord allows and sends them to the target. Order is preserved.
+    """
+
+    def __init__(self, source, target, prefetch=200):
+        """
+        Initialize the Forwarder object.
+
+        Args:
+            source (discord.TextChannel): The channel to forward from.
+            target (discord.abc.Messageable): The channel to forward to.
+            prefetch (int, optional): Max number of items buffered between fetching and sending. Defaults to 200.
+        """
+        self.log = Log.get("forward")
+        self.source = source
+        self.target = target
+        self.queue = asyncio.Queue(maxsize=prefetch)
+        self.forwarded = 0
+        self.sent = 0
+
+    @staticmethod
+    def to_items(m):
+        """
+        Convert a source message into forwardable items.
+
+        Args:
+            m (discord.Message): The message to convert.
+
+        Returns:
+            list: Items, each either a discord.Embed or a str sent as plain content.
+        """
+        if m.author == bot.user:
+            return list(m.embeds)
+        items = []
+        if m.content:
+            embed = discord.Embed(
+                description=m.content, color=m.author.color, timestamp=m.created_at
+            )
+            embed.set_author(name=m.author.display_name, icon_url=m.author.avatar.url)
+            items.append(embed)
+        for att in m.attachments:
+            content_type = att.content_type or ""
+            if content_type.startswith("image"):
+                embed = discord.Embed(color=m.author.color, timestamp=m.created_at)
+                embed.set_author(
+                    name=m.author.display_name, icon_url=m.author.avatar.url
+                )
+                embed.set_image(url=att.url)
+                items.append(embed)
+            elif content_type.startswith("video"):
+                items.append(att.url)
+        return items
+
+    async def produce(self, after):
+        """
+        Page the source history and feed the items into the queue.
+
+        Args:
+            after (discord.Message): The message to start after.
+        """
+        async for m in self.source.history(limit=None, after=after, oldest_first=True):
+            for item in self.to_items(m):
+                await self.queue.put(item)
+            self.forwarded += 1
+        await self.queue.put(None)
+
+    async def consume(self):
+        """
+        Pack the queued items into messages and send them in order.
+        """
+        bundle = []
+        chars = 0
+        while (item := await self.queue.get()) is not None:
+            if isinstance(item, str):
+                if bundle:
+                    await self.send(embeds=bundle)
+                    bundle, chars = [], 0
+                await self.send(content=item)
+                continue
+            size = len(item)
+            if bundle and (
+                len(bundle) >= MAX_EMBEDS or chars + size > MAX_EMBED_CHARS
+            ):
+                await self.send(embeds=bundle)
+                bundle, chars = [], 0
+            bundle.append(item)
+            chars += size
+        if bundle:
+            await self.send(embeds=bundle)
+
+    async def send(self, **kwargs):
+        """
+        Send one message to the target.
+        """
+        await self.target.send(**kwargs)
+        self.sent += 1
+
+    async def run(self, after=None):
+        """
+        Forward every message after the given one.
+
+        Args:
+            after (discord.Message, optional): The message to start after. Defaults to None.
+
+        Returns:
+            tuple: Number of forwarded messages, number of sent messages and messages per second.
+        """
+        start = time.perf_counter()
+        with rest.bulk():
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(self.produce(after))
+                tg.create_task(self.consume())
+        elapsed = time.perf_counter() - start
+        rate = self.forwarded / elapsed if elapsed > 0 else 0.0
+        self.log.info(
+            f"forwarded {self.forwarded} messages in {self.sent} sends, {elapsed:.2f}s, {rate:.2f} msg/s"
+        )
+        return self.forwarded, self.sent, rate
@@ -1,34 +1,217 @@
 import os
+import time
 import logging
-from datetime import timezone, timedelta
-import httpx
-import discord
+from datetime import tzinfo, timedelta
 import yaml
 
-import coloredlogs
+STARTED = time.perf_counter()
+
+CONFIG_PATH = "./config.yml"
+
+# filled by load_config, shared by every module
+cfg = {}
+
+
+def load_config(path=CONFIG_PATH):
+    """
+    Load the config file and the .env file into the shared cfg.
+
+    Args:
+        path (str, optional): The path of the config file. Defaults to CONFIG_PATH.
+
+    Returns:
+        dict: The shared cfg.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        cfg.update(yaml.safe_load(f))
+    if os.path.exists(".env"):
+        import dotenv
+
+        dotenv.load_dotenv()
+    return cfg
+
+
+class Lazy:
+    """
+    Proxy that constructs the wrapped object on first attribute access.
+    """
+
+    def __init__(self, factory):
+        object.__setattr__(self, "_lazy_factory", factory)
+        object.__setattr__(self, "_lazy_obj", None)
+
+    def get(self):
+        """
+        Get the wrapped object, constructing it if needed.
+        """
+        if self._lazy_obj is None:
+            object.__setattr__(self, "_lazy_obj", self._lazy_factory())
+        return self._lazy_obj
+
+    def is_built(self):
+        return self._lazy_obj is not None
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.get(), name, value)
+
+
+def get_intents(mode):
+    """
+    Build the gateway intents for the given mode.
+
+    Args:
+        mode (str): "full" for all intents, "lean" for only what the features use.
+
+    Returns:
+        discord.Intents: The intents.
+    """
+    import discord
+
+    if mode == "full":
+        return discord.Intents.all()
+    intents = discord.Intents.none()
+    # channels, roles and the bot's own member
+    intents.guilds = True
+    # on_message archiving and conversations
+    intents.guild_messages = True
+    intents.message_content = True
+    return intents
+
+
+# connection limits and timeouts per traffic class, overridden by cfg["http"][tier]
+HTTP_TIERS = {
+    # bulk attachment streaming from the Discord CDN
+    "cdn": {
+        "max_connections": 8,
+        "max_keepalive_connections": 8,
+        "keepalive_expiry": 30,
+        "connect": 5.0,
+        "read": 60.0,
+        "write": 30.0,
+        "pool": 60.0,
+        "http2": True,
+    },
+    # small latency-sensitive calls such as Bark pushes
+    "api": {
+        "max_connections": 4,
+        "max_keepalive_connections": 2,
+        "keepalive_expiry": 60,
+        "connect": 2.0,
+        "read": 5.0,
+        "write": 5.0,
+        "pool": 2.0,
+        "http2": False,
+    },
+}
+
+
+def create_httpx_client(tier):
+    """
+    Create the connection pool of a traffic class.
+
+    HTTP/2 is used where configured and the h2 package is installed.
+
+    Args:
+        tier (str): One of HTTP_TIERS.
+
+    Returns:
+        httpx.AsyncClient: The client.
+    """
+    import httpx
+
+    options = dict(HTTP_TIERS[tier], **cfg.get("http", {}).get(tier, {}))
+    http2 = options["http2"]
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            http2 = False
+    return httpx.AsyncClient(
+        proxy=os.getenv("PROXY"),
+        http2=http2,
+        timeout=httpx.Timeout(
+            connect=options["connect"],
+            read=options["read"],
+            write=options["write"],
+            pool=options["pool"],
+        ),
+        limits=httpx.Limits(
+            max_connections=options["max_connections"],
+            max_keepalive_connections=options["max_keepalive_connections"],
+            keepalive_expiry=options["keepalive_expiry"],
+        ),
+    )
+
+
+def create_bot():
+    import discord
+
+    return discord.Bot(
+        intents=get_intents(cfg.get("intents", "full")), proxy=os.getenv("PROXY")
+    )
+
+
+# set up httpx clients and discord bot, constructed on first use
+cdn_client = Lazy(lambda: create_httpx_client("cdn"))
+api_client = Lazy(lambda: create_httpx_client("api"))
+bot = Lazy(create_bot)
+
+
+async def close_http_clients():
+    """
+    Close the httpx clients that have been built.
+    """
+    for client in [cdn_client, api_client]:
+        if client.is_built():
+            await client.aclose()
+
+
+class ConfigTimezone(tzinfo):
+    """
+    Fixed offset timezone read from cfg["timezone"] when it is used.
+    """
+
+    def utcoffset(self, dt):
+        return timedelta(hours=cfg["timezone"])
+
+    def dst(self, dt):
+        return timedelta(0)
+
+    def tzname(self, dt):
+        return f"UTC{cfg['timezone']:+g}"
 
-# load cfg
-with open("./config.yml", "r", encoding="utf-8") as f:
-    cfg = yaml.safe_load(f)
-if os.path.exists(".env"):
-    import dotenv
 
-    dotenv.load_dotenv()
-# set up httpx client and discord bot
-httpx_client = httpx.AsyncClient(proxy=os.getenv("PROXY"))
-bot = discord.Bot(intents=discord.Intents.all(), proxy=os.getenv("PROXY"))
 # set timezone
-tz = timezone(timedelta(hours=cfg["timezone"]))
+tz = ConfigTimezone()
+
 
+def startup_report():
+    """
+    Report the time since startup and the resident memory of the process.
 
-def update_cfg():
-    guild = bot.get_guild(cfg["guild_id"])
-    cfg["channel"] = {ch.name: ch.id for ch in guild.text_channels}
-    cfg["member"] = {m.name: m.id for m in guild.members}
+    Returns:
+        str: The report.
+    """
+    rss = None
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) / 1024
+                    break
+    except OSError:
+        import resource
+
+        # peak instead of current rss where /proc is unavailable
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return f"intents={cfg.get('intents', 'full')} ready in {time.perf_counter() - STARTED:.2f}s, rss {rss:.1f}MB"
 
 
 class Log:
-    coloredlogs.install(fmt="[%(levelname)s][%(name)s] %(message)s", level="INFO")
+    FORMAT = "[%(levelname)s][%(name)s] %(message)s"
 
     @staticmethod
     def get(name):
@@ -36,4 +219,6 @@ class Log:
 
     @staticmethod
     def set_level(level):
-        coloredlogs.install(fmt="[%(levelname)s][%(name)s] %(message)s", level=level)
+        import coloredlogs
+
+        coloredlogs.install(fmt=Log.FORMAT, level=level)
@@ -0,0 +1,236 @@
+"""
+contains the integrity manifest of the backup folder
+"""
+
+import os
+import mmap
+import sqlite3
+import asyncio
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from os.path import join as pj
+from src.core.init import Log
+from src.core.scheduler import STATE_FILE
+
+MANIFEST_FILE = ".manifest.db"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    channel_id INTEGER,
+    message_id INTEGER,
+    url TEXT
+);
+"""
+# files that belong to the pipeline itself, never reported as orphaned
+IGNORED_SUFFIXES = (
+    ".part",
+    ".part.json",
+    STATE_FILE,
+    f"{STATE_FILE}.tmp",
+    MANIFEST_FILE,
+    f"{MANIFEST_FILE}-wal",
+    f"{MANIFEST_FILE}-shm",
+)
+BATCH_SIZE = 64
+
+
+def hash_file(path):
+    """
+    Hash a file through a memory map.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        str: The hex SHA-256 of the file.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                digest.update(m)
+    return digest.hexdigest()
+
+
+def check_batch(root, entries):
+    """
+    Check files against their manifest entries. Runs in a worker process.
+
+    Args:
+        root (str): The backup root.
+        entries (list): The (path, size, sha256) entries.
+
+    Returns:
+        list: The (path, problem) pairs, problem being missing, truncated or corrupted.
+    """
+    problems = []
+    for path, size, sha256 in entries:
+        abspath = pj(root, path)
+        try:
+            actual = os.path.getsize(abspath)
+        except OSError:
+            problems.append((path, "missing"))
+            continue
+        if actual != size:
+            problems.append((path, "truncated"))
+        elif hash_file(abspath) != sha256:
+            problems.append((path, "corrupted"))
+    return problems
+
+
+class Manifest:
+    """
+    Path, size, hash and source message of every file written to the backup folder.
+
+    Backup records each attachment and Markdown file as it writes it. verify()
+    rehashes the whole tree on a process pool and reports the files that are
+    missing, truncated, corrupted or not in the manifest.
+    """
+
+    def __init__(self):
+        """
+        Initialize the Manifest object.
+        """
+        self.log = Log.get("manifest")
+        self.root = None
+        self.db = None
+
+    def open(self, root):
+        """
+        Open the manifest of a backup root in WAL mode.
+
+        Args:
+            root (str): The backup root.
+        """
+        if self.db is not None and self.root == root:
+            return
+        self.root = root
+        self.db = sqlite3.connect(pj(root, MANIFEST_FILE), isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    async def record(self, abspath, channel_id=None, message_id=None, url=None):
+        """
+        Hash a file that was just written and record it.
+
+        Args:
+            abspath (str): The absolute path of the file.
+            channel_id (int, optional): The channel of the source message.
+            message_id (int, optional): The source message.
+            url (str, optional): Where the file was downloaded from.
+        """
+        sha256 = await asyncio.to_thread(hash_file, abspath)
+        self.db.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                os.path.relpath(abspath, self.root),
+                os.path.getsize(abspath),
+                sha256,
+                channel_id,
+                message_id,
+                url,
+            ),
+        )
+
+    def expect(self, abspath, channel_id=None, message_id=None, url=None):
+        """
+        Record a file that could not be written, so verify() reports it as missing.
+
+        Args:
+            abspath (str): The absolute path the file should have.
+            channel_id (int, optional): The channel of the source message.
+            message_id (int, optional): The source message.
+            url (str, optional): Where the file should be downloaded from.
+        """
+        self.db.execute(
+            "INSERT OR IGNORE INTO files VALUES (?, -1, '', ?, ?, ?)",
+            (os.path.relpath(abspath, self.root), channel_id, message_id, url),
+        )
+
+    def has(self, abspath):
+        """
+        Check whether a file is recorded with its content, not just expected.
+
+        Args:
+            abspath (str): The absolute path of the file.
+
+        Returns:
+            bool: Whether the file has a hash in the manifest.
+        """
+        row = self.db.execute(
+            "SELECT size FROM files WHERE path = ?", (os.path.relpath(abspath, self.root),)
+        ).fetchone()
+        return row is not None and row[0] >= 0
+
+    async def adopt(self, paths):
+        """
+        Record files that are not in the manifest as they are, without a source.
+
+        Args:
+            paths (list): The paths of the files, relative to the backup root.
+        """
+        for path in paths:
+            await self.record(pj(self.root, path))
+        self.log.info(f"adopted {len(paths)} files")
+
+    def source(self, path):
+        """
+        Get the source of a recorded file.
+
+        Args:
+            path (str): The path of the file, relative to the backup root.
+
+        Returns:
+            tuple: The channel_id, message_id and url of the file, or None if it is not recorded.
+        """
+        return self.db.execute(
+            "SELECT channel_id, message_id, url FROM files WHERE path = ?", (path,)
+        ).fetchone()
+
+    def orphans(self, known):
+        orphans = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(IGNORED_SUFFIXES):
+                    continue
+                path = os.path.relpath(pj(dirpath, filename), self.root)
+                if path not in known:
+                    orphans.append(path)
+        return orphans
+
+    async def verify(self, workers=None):
+        """
+        Rehash every recorded file in parallel and look for unrecorded ones.
+
+        Args:
+            workers (int, optional): The number of processes. Defaults to the number of cores.
+
+        Returns:
+            dict: The paths that are missing, truncated, corrupted and orphaned.
+        """
+        entries = self.db.execute("SELECT path, size, sha256 FROM files").fetchall()
+        report = {"missing": [], "truncated": [], "corrupted": [], "orphaned": []}
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            batches = [
+                loop.run_in_executor(
+                    pool, check_batch, self.root, entries[i : i + BATCH_SIZE]
+                )
+                for i in range(0, len(entries), BATCH_SIZE)
+            ]
+            for problems in await asyncio.gather(*batches):
+                for path, problem in problems:
+                    report[problem].append(path)
+        known = {path for path, _, _ in entries}
+        report["orphaned"] = await asyncio.to_thread(self.orphans, known)
+        self.log.info(
+            f"verified {len(entries)} files: "
+            + ", ".join(f"{len(paths)} {problem}" for problem, paths in report.items())
+        )
+        return report
+
+
+manifest = Manifest()
@@ -0,0 +1,165 @@
+"""
+contains the recompression of backed-up images and their thumbnails
+"""
+
+import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from os.path import join as pj
+from src.core.init import cfg, Log
+
+# formats worth recompressing; animated GIFs and videos are kept as they are
+TRANSCODABLE = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff"}
+THUMB_DIR = "thumbs"
+
+
+def transcode(path, fmt, quality, thumb_size, keep_original):
+    """
+    Recompress an image and write its thumbnail. Runs in a worker process.
+
+    Args:
+        path (str): The path of the original image.
+        fmt (str): The target format, e.g. "webp".
+        quality (int): The target quality.
+        thumb_size (int): The max side of the thumbnail in pixels, 0 for none.
+        keep_original (bool): Whether to keep the original next to the new file.
+
+    Returns:
+        tuple: The path of the kept image, the path of the thumbnail or None,
+            and the bytes saved.
+    """
+    from PIL import Image
+
+    stem, _ = os.path.splitext(path)
+    target = f"{stem}.{fmt}"
+    tmp = f"{stem}.tmp.{fmt}"
+    original_size = os.path.getsize(path)
+    # already in the target format: recompressing would replace the kept original
+    in_place = keep_original and target == path
+    thumb = None
+    try:
+        with Image.open(path) as img:
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+            if not in_place:
+                img.save(tmp, quality=quality)
+            if thumb_size:
+                thumb_dir = pj(os.path.dirname(path), THUMB_DIR)
+                os.makedirs(thumb_dir, exist_ok=True)
+                thumb = pj(thumb_dir, os.path.basename(target))
+                img.thumbnail((thumb_size, thumb_size))
+                img.save(thumb, quality=quality)
+    except BaseException:
+        # leave the original as the only copy
+        for leftover in [tmp, thumb]:
+            if leftover and os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    if in_place:
+        return path, thumb, 0
+    saved = original_size - os.path.getsize(tmp)
+    if saved <= 0:
+        # the original is smaller already, keep it under its own name
+        os.remove(tmp)
+        return path, thumb, 0
+    os.replace(tmp, target)
+    if not keep_original and target != path:
+        os.remove(path)
+    return target, thumb, saved
+
+
+class MediaStage:
+    """
+    Optional post-download stage that recompresses images on a process pool.
+
+    Images are saved in the configured format and quality, with a small
+    thumbnail for the Markdown link. The original is removed unless
+    keep_original is set, or the recompressed file would be larger. Nothing
+    happens without Pillow or while backup.media.enabled is off.
+    """
+
+    def __init__(self):
+        """
+        Initialize the MediaStage object.
+        """
+        self.log = Log.get("media")
+        self.pool = None
+        self.available = None
+
+    @property
+    def options(self):
+        return cfg["backup"].get("media", {})
+
+    @property
+    def enabled(self):
+        if not self.options.get("enabled", False):
+            return False
+        if self.available is None:
+            try:
+                import PIL  # noqa: F401
+
+                self.available = True
+            except ImportError:
+                self.log.warning("Pillow is not installed, images are kept as they are")
+                self.available = False
+        return self.available
+
+    @property
+    def format(self):
+        return self.options.get("format", "webp").lower()
+
+    def thumb_path(self, relpath):
+        """
+        Get the thumbnail path of an image path.
+        """
+        head, tail = os.path.split(relpath)
+        return pj(head, THUMB_DIR, tail)
+
+    def wants(self, ext):
+        return self.enabled and ext.lower() in TRANSCODABLE
+
+    async def process(self, path):
+        """
+        Recompress an image without blocking the event loop.
+
+        Any failure is logged and leaves the original image in place.
+
+        Args:
+            path (str): The path of the downloaded image.
+
+        Returns:
+            tuple: The path of the kept image, the path of the thumbnail or None,
+                and the bytes saved.
+        """
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.options.get("workers"))
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self.pool,
+                transcode,
+                path,
+                self.format,
+                self.options.get("quality", 80),
+                self.options.get("thumbnail", 320),
+                self.options.get("keep_original", False),
+            )
+        except BrokenProcessPool as e:
+            # a worker died, e.g. killed for memory: start a new pool next time
+            self.log.error(f"failed to transcode {path}, keeping the original: {e!r}")
+            self.pool.shutdown(wait=False)
+            self.pool = None
+            return path, None, 0
+        except Exception as e:
+            # unreadable image, unknown format or decompression bomb
+            self.log.error(f"failed to transcode {path}, keeping the original: {e!r}")
+            return path, None, 0
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+media = MediaStage()
@@ -0,0 +1,153 @@
+"""
+contains the resolution of mentions and custom emoji in backed-up text
+"""
+
+import re
+from collections import OrderedDict
+import discord
+from src.core.init import cfg, bot, Log
+from src.core.directory import directory
+
+TOKEN = re.compile(r"<(@!?|@&|#)(\d+)>|<a?:(\w+):(\d+)>")
+# text of the custom emoji in cfg["emoji"], by config key
+EMOJI_TEXT = {"fate": "🔮"}
+
+
+def emoji_table():
+    """
+    Build the translation table of the custom emoji, by emoji id.
+
+    The config keys of cfg["emoji"] are mapped through EMOJI_TEXT, overridden by
+    cfg["backup"]["emoji"]. Other custom emoji render as :name:.
+
+    Returns:
+        dict: The text of each known custom emoji id.
+    """
+    texts = dict(EMOJI_TEXT, **cfg["backup"].get("emoji", {}))
+    table = {}
+    for key, emoji in cfg.get("emoji", {}).items():
+        match = TOKEN.fullmatch(str(emoji))
+        if match and match[4] and key in texts:
+            table[int(match[4])] = texts[key]
+    return table
+
+
+class MentionResolver:
+    """
+    Resolver of user, role and channel mentions and custom emoji for one backup run.
+
+    Text is scanned once for all token kinds. Names come from the gateway cache
+    and the directory, then from the API, and are kept in an LRU cache. An id
+    that cannot be resolved is not tried again during the run, and its token is
+    left as it is. A name evicted from the cache is resolved again when needed.
+    """
+
+    def __init__(self, size=4096):
+        """
+        Initialize the MentionResolver object.
+
+        Args:
+            size (int, optional): Max number of names kept. Defaults to 4096.
+        """
+        self.log = Log.get("mentions")
+        self.size = size
+        self.names = OrderedDict()
+        # ids that could not be resolved, never evicted
+        self.unresolved = set()
+        self.roles = None
+        self.emoji = emoji_table()
+
+    def remember(self, key, name):
+        self.names[key] = name
+        if len(self.names) > self.size:
+            self.names.popitem(last=False)
+        return name
+
+    async def user(self, user_id):
+        guild = bot.get_guild(cfg["guild_id"])
+        member = (guild.get_member(user_id) if guild else None) or directory.members.get(
+            user_id
+        )
+        if member is not None:
+            return member.display_name
+        if user_id in directory.member_names:
+            return directory.member_names[user_id]
+        user = await bot.fetch_user(user_id)
+        return user.display_name
+
+    async def role(self, role_id):
+        guild = bot.get_guild(cfg["guild_id"])
+        if guild is not None:
+            role = guild.get_role(role_id)
+            return role.name if role else None
+        if self.roles is None:
+            guild = await bot.fetch_guild(cfg["guild_id"])
+            self.roles = {role.id: role.name for role in guild.roles}
+        return self.roles.get(role_id)
+
+    async def channel(self, channel_id):
+        if channel_id in directory.channel_names:
+            return directory.channel_names[channel_id]
+        channel = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+        return channel.name
+
+    async def name(self, kind, target_id):
+        """
+        Get the name behind a mention, or None when it cannot be resolved.
+
+        Args:
+            kind (str): The mention prefix, "@", "@!", "@&" or "#".
+            target_id (int): The id of the user, role or channel.
+
+        Returns:
+            str: The name.
+        """
+        key = (kind, target_id)
+        if key in self.names:
+            self.names.move_to_end(key)
+            return self.names[key]
+        if key in self.unresolved:
+            return None
+        try:
+            if kind == "@&":
+                name = await self.role(target_id)
+            elif kind == "#":
+                name = await self.channel(target_id)
+            else:
+                name = await self.user(target_id)
+        except discord.HTTPException as e:
+            self.log.warning(f"failed to resolve <{kind}{target_id}>: {e}")
+            name = None
+        if name is None:
+            self.unresolved.add(key)
+            return None
+        return self.remember(key, name)
+
+    async def render(self, text):
+        """
+        Replace the mentions and custom emoji in a text with readable names.
+
+        Args:
+            text (str): The text to render.
+
+        Returns:
+            str: The rendered text.
+        """
+        if not text or "<" not in text:
+            return text
+        parts = []
+        last = 0
+        for match in TOKEN.finditer(text):
+            parts.append(text[last : match.start()])
+            last = match.end()
+            kind, target_id, emoji_name, emoji_id = match.groups()
+            if emoji_id:
+                parts.append(self.emoji.get(int(emoji_id), f":{emoji_name}:"))
+                continue
+            name = await self.name("@" if kind == "@!" else kind, int(target_id))
+            if name is None:
+                parts.append(match[0])
+            else:
+                parts.append(f"#{name}" if kind == "#" else f"@{name}")
+        parts.append(text[last:])
+        return "".join(parts)
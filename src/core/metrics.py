@@ -0,0 +1,209 @@
+"""
+contains the in-process metrics and their Prometheus text endpoint
+"""
+
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from src.core.init import cfg, Log
+
+PREFIX = "cortana_"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}"
+        yield f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {self.count}"
+        yield f"{name}_sum{format_labels(labels)} {self.sum}"
+        yield f"{name}_count{format_labels(labels)} {self.count}"
+
+
+class RateLimitHandler(logging.Handler):
+    """
+    Log handler that records the waits announced by discord's HTTP client on 429.
+    """
+
+    def __init__(self, metrics):
+        super().__init__(level=logging.WARNING)
+        self.metrics = metrics
+
+    def emit(self, record):
+        if str(record.msg).startswith("We are being rate limited") and record.args:
+            self.metrics.inc("rate_limited_total")
+            self.metrics.inc("rate_limit_wait_seconds_total", float(record.args[0]))
+
+
+class Metrics:
+    """
+    Registry of counters, gauges and histograms.
+
+    Metrics are keyed by name and a sorted tuple of labels, rendered in the
+    Prometheus text format on a local endpoint and dumped to the log on demand.
+    """
+
+    def __init__(self):
+        """
+        Initialize the Metrics object.
+        """
+        self.log = Log.get("metrics")
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.server = None
+        self.lag_task = None
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        if key not in self.histograms:
+            self.histograms[key] = Histogram()
+        self.histograms[key].observe(value)
+
+    @asynccontextmanager
+    async def timer(self, name, **labels):
+        """
+        Observe the duration of the block in seconds, labelled with its outcome.
+
+        Args:
+            name (str): The histogram name.
+            **labels: The labels of the histogram.
+        """
+        start = time.perf_counter()
+        status = "error"
+        try:
+            yield
+            status = "ok"
+        finally:
+            self.observe(name, time.perf_counter() - start, status=status, **labels)
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text format.
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        for kind, metrics in [("counter", self.counters), ("gauge", self.gauges)]:
+            typed = set()
+            for (name, labels), value in sorted(metrics.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                    typed.add(name)
+                lines.append(f"{PREFIX}{name}{format_labels(labels)} {value}")
+        typed = set()
+        for (name, labels), histogram in sorted(
+            self.histograms.items(), key=lambda item: item[0]
+        ):
+            if name not in typed:
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                typed.add(name)
+            lines.extend(histogram.lines(PREFIX + name, labels))
+        return "\n".join(lines) + "\n"
+
+    def dump(self):
+        """
+        Write every metric to the log.
+        """
+        self.log.info("metrics dump:\n" + self.render())
+
+    def instrument(self, bot):
+        """
+        Count and time every Discord REST call per route and record the rate limit waits.
+
+        Args:
+            bot (discord.Bot): The bot to instrument.
+        """
+        http = bot.http
+        request = http.request
+
+        async def timed_request(route, **kwargs):
+            async with self.timer(
+                "discord_request_seconds", route=f"{route.method} {route.path}"
+            ):
+                return await request(route, **kwargs)
+
+        http.request = timed_request
+        logging.getLogger("discord.http").addHandler(RateLimitHandler(self))
+
+    async def watch_lag(self, interval=1.0):
+        """
+        Measure how late the event loop wakes up from a sleep.
+
+        Args:
+            interval (float, optional): Seconds between samples. Defaults to 1.0.
+        """
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.perf_counter() - start - interval)
+            self.observe("event_loop_lag_seconds", lag)
+
+    async def serve(self, request_reader, writer):
+        try:
+            await request_reader.readuntil(b"\r\n\r\n")
+            body = self.render().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\n".encode()
+                + b"Connection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        """
+        Start the event loop lag probe and the local endpoint from cfg["metrics"].
+        """
+        if self.lag_task is None:
+            self.lag_task = asyncio.create_task(self.watch_lag())
+        metrics_cfg = cfg.get("metrics", {})
+        if self.server is None and metrics_cfg.get("port"):
+            host = metrics_cfg.get("host", "127.0.0.1")
+            self.server = await asyncio.start_server(
+                self.serve, host, metrics_cfg["port"]
+            )
+            self.log.info(f"serving metrics on {host}:{metrics_cfg['port']}")
+
+
+metrics = Metrics()
@@ -0,0 +1,324 @@
+"""
+contains the local mirror of the backed-up channels
+"""
+
+import json
+import sqlite3
+import asyncio
+from types import SimpleNamespace
+from datetime import datetime
+import discord
+from src.core.init import cfg, bot, Log
+from src.core.directory import directory
+from src.core.rest import rest
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    author_name TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    created_iso TEXT NOT NULL,
+    edited_iso TEXT,
+    content TEXT NOT NULL,
+    embeds TEXT NOT NULL,
+    attachments TEXT NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    author_id INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS messages_channel_created ON messages (channel_id, created_at);
+CREATE TABLE IF NOT EXISTS channels (
+    channel_id INTEGER PRIMARY KEY,
+    complete INTEGER NOT NULL DEFAULT 0,
+    last_id INTEGER
+);
+"""
+# fields of a message update carrying the whole message rather than a partial one
+FULL_MESSAGE_KEYS = {"author", "content", "timestamp", "embeds", "attachments"}
+
+
+class MirroredMessage:
+    """
+    Message read back from the mirror, with the attributes the Markdown renderer uses.
+    """
+
+    __slots__ = [
+        "id",
+        "channel",
+        "author",
+        "content",
+        "embeds",
+        "attachments",
+        "created_at",
+        "edited_at",
+    ]
+
+    def __init__(self, row):
+        self.id = row["id"]
+        self.channel = SimpleNamespace(id=row["channel_id"])
+        self.author = SimpleNamespace(
+            id=row["author_id"], display_name=row["author_name"]
+        )
+        self.content = row["content"]
+        self.embeds = [discord.Embed.from_dict(e) for e in json.loads(row["embeds"])]
+        self.attachments = [
+            SimpleNamespace(**att) for att in json.loads(row["attachments"])
+        ]
+        self.created_at = datetime.fromisoformat(row["created_iso"])
+        self.edited_at = (
+            datetime.fromisoformat(row["edited_iso"]) if row["edited_iso"] else None
+        )
+
+
+class Mirror:
+    """
+    Event-sourced SQLite mirror of channel messages.
+
+    Creates, edits and deletes are recorded from gateway events as they happen,
+    an edit being fetched only when its event carries a partial message, and a
+    history check after each login fills the gap left by downtime. Once a
+    channel has been backfilled completely, Backup reads it from here instead of
+    paging the API. Edits and deletes made during downtime are not recovered.
+    Attachment links are stored with their ids, and Backup refreshes the ones
+    that have expired by the time they are read back.
+    """
+
+    def __init__(self):
+        """
+        Initialize the Mirror object.
+        """
+        self.log = Log.get("mirror")
+        self.db = None
+        self.channel_names = []
+        self.syncing = None
+
+    @property
+    def enabled(self):
+        return cfg.get("mirror", {}).get("enabled", True)
+
+    def open(self):
+        """
+        Open the database in WAL mode and create the schema.
+        """
+        if self.db is not None:
+            return
+        path = cfg.get("mirror", {}).get("path", "./mirror.db")
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        # replaced rows fire delete triggers, which keep the rollups exact
+        self.db.execute("PRAGMA recursive_triggers=ON")
+        self.db.executescript(SCHEMA)
+        columns = {row["name"] for row in self.db.execute("PRAGMA table_info(messages)")}
+        if "author_id" not in columns:
+            self.db.execute(
+                "ALTER TABLE messages ADD COLUMN author_id INTEGER NOT NULL DEFAULT 0"
+            )
+            # messages recorded before author ids were kept get them from a full resync
+            self.db.execute("UPDATE channels SET complete = 0")
+            self.log.info("added author ids, resyncing every channel")
+
+    def attach(self, channel_names):
+        """
+        Register the event listeners for the given channels.
+
+        Args:
+            channel_names (list): The names of the channels to mirror.
+        """
+        if not self.enabled:
+            return
+        self.channel_names = list(channel_names)
+        for listener in [
+            self.on_message,
+            self.on_raw_message_edit,
+            self.on_raw_message_delete,
+            self.on_raw_bulk_message_delete,
+        ]:
+            bot.add_listener(listener, listener.__name__)
+
+    def channel_ids(self):
+        ids = set()
+        for name in self.channel_names:
+            try:
+                ids.add(directory.channel_id(name))
+            except KeyError:
+                continue
+        return ids
+
+    def tracked(self, channel_id):
+        return self.db is not None and channel_id in self.channel_ids()
+
+    def record(self, m):
+        """
+        Insert or replace a message.
+
+        The channel watermark is left alone: only sync_channel() advances it,
+        so a live message never hides the gap left by downtime.
+
+        Args:
+            m (discord.Message): The message to record.
+        """
+        self.db.execute(
+            "INSERT OR REPLACE INTO messages (id, channel_id, author_name, created_at, "
+            "created_iso, edited_iso, content, embeds, attachments, author_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                m.id,
+                m.channel.id,
+                m.author.display_name,
+                m.created_at.timestamp(),
+                m.created_at.isoformat(),
+                m.edited_at.isoformat() if m.edited_at else None,
+                m.content,
+                json.dumps([e.to_dict() for e in m.embeds], ensure_ascii=False),
+                json.dumps(
+                    [
+                        {
+                            "id": att.id,
+                            "filename": att.filename,
+                            "url": att.url,
+                            "content_type": att.content_type,
+                        }
+                        for att in m.attachments
+                    ]
+                ),
+                m.author.id,
+            ),
+        )
+
+    def advance(self, channel_id, last_id):
+        self.db.execute(
+            "INSERT INTO channels (channel_id, last_id) VALUES (?, ?) "
+            "ON CONFLICT (channel_id) DO UPDATE SET last_id = MAX(COALESCE(last_id, 0), excluded.last_id)",
+            (channel_id, last_id),
+        )
+
+    async def on_message(self, message):
+        if self.tracked(message.channel.id):
+            self.record(message)
+
+    async def on_raw_message_edit(self, payload):
+        if not self.tracked(payload.channel_id):
+            return
+        channel = bot.get_channel(payload.channel_id)
+        # edits, embed unfurls included, carry the whole message: no fetch needed
+        if FULL_MESSAGE_KEYS <= payload.data.keys():
+            self.record(
+                discord.Message(state=channel._state, channel=channel, data=payload.data)
+            )
+            return
+        try:
+            with rest.bulk():
+                message = await channel.fetch_message(payload.message_id)
+        except discord.NotFound:
+            return
+        self.record(message)
+
+    async def on_raw_message_delete(self, payload):
+        if self.tracked(payload.channel_id):
+            self.db.execute(
+                "UPDATE messages SET deleted = 1 WHERE id = ?", (payload.message_id,)
+            )
+
+    async def on_raw_bulk_message_delete(self, payload):
+        if self.tracked(payload.channel_id):
+            self.db.executemany(
+                "UPDATE messages SET deleted = 1 WHERE id = ?",
+                [(message_id,) for message_id in payload.message_ids],
+            )
+
+    async def sync_channel(self, channel):
+        row = self.db.execute(
+            "SELECT complete, last_id FROM channels WHERE channel_id = ?", (channel.id,)
+        ).fetchone()
+        after = None
+        if row and row["complete"] and row["last_id"]:
+            after = discord.Object(row["last_id"])
+        count = 0
+        with rest.bulk():
+            async for m in channel.history(limit=None, after=after, oldest_first=True):
+                self.record(m)
+                self.advance(channel.id, m.id)
+                count += 1
+        self.db.execute(
+            "INSERT INTO channels (channel_id, complete) VALUES (?, 1) "
+            "ON CONFLICT (channel_id) DO UPDATE SET complete = 1",
+            (channel.id,),
+        )
+        self.log.info(f"synced {count} messages of #{channel.name}")
+
+    async def sync(self):
+        """
+        Fill the gaps since the last recorded message of every channel.
+
+        A channel seen for the first time is backfilled completely.
+        """
+        self.open()
+        for channel_id in self.channel_ids():
+            channel = bot.get_channel(channel_id)
+            if channel is None:
+                continue
+            try:
+                await self.sync_channel(channel)
+            except discord.HTTPException as e:
+                self.log.error(f"sync of #{channel.name} failed: {e}")
+
+    def start_sync(self):
+        """
+        Start the gap-filling sync in the background, unless one is running.
+        """
+        if not self.enabled or (self.syncing and not self.syncing.done()):
+            return
+        self.syncing = asyncio.create_task(self.sync())
+
+    def covers(self, channel_id):
+        """
+        Whether the mirror holds the complete history of a channel.
+
+        Args:
+            channel_id (int): The id of the channel.
+
+        Returns:
+            bool: Whether the channel can be read from the mirror.
+        """
+        if self.db is None or (self.syncing and not self.syncing.done()):
+            return False
+        row = self.db.execute(
+            "SELECT complete FROM channels WHERE channel_id = ?", (channel_id,)
+        ).fetchone()
+        return bool(row and row["complete"])
+
+    def messages(self, channel_id, after=None, before=None):
+        """
+        Read the messages of a channel, oldest first, skipping deleted ones.
+
+        Args:
+            channel_id (int): The id of the channel.
+            after (datetime.datetime, optional): Only messages created after it.
+            before (datetime.datetime, optional): Only messages created before it.
+
+        Yields:
+            MirroredMessage: The messages.
+        """
+        query = "SELECT * FROM messages WHERE channel_id = ? AND deleted = 0"
+        params = [channel_id]
+        if after is not None:
+            query += " AND created_at > ?"
+            params.append(after.timestamp())
+        if before is not None:
+            query += " AND created_at < ?"
+            params.append(before.timestamp())
+        for row in self.db.execute(query + " ORDER BY id", params):
+            yield MirroredMessage(row)
+
+    def earliest(self, channel_id):
+        row = self.db.execute(
+            "SELECT created_iso FROM messages WHERE channel_id = ? AND deleted = 0 "
+            "ORDER BY id LIMIT 1",
+            (channel_id,),
+        ).fetchone()
+        return datetime.fromisoformat(row["created_iso"]) if row else None
+
+
+mirror = Mirror()
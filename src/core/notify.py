@@ -0,0 +1,159 @@
+"""
+contains the dispatcher for Bark push notifications
+"""
+
+import time
+import asyncio
+from collections import deque
+import httpx
+from src.core.init import cfg, api_client, Log
+from src.core.metrics import metrics
+
+
+class Notifier:
+    """
+    Background dispatcher for Bark pushes.
+
+    Pushes are delivered by background tasks on the api connection pool, with
+    its strict timeout policy, and retried with exponential backoff, so commands
+    can respond to the interaction right away.
+    """
+
+    def __init__(self, client=None, retries=3, backoff=0.5, window=200):
+        """
+        Initialize the Notifier object.
+
+        Args:
+            client (httpx.AsyncClient, optional): The client to use, e.g. one pointing at a mock Bark server.
+                Defaults to the api tier of the shared clients.
+            retries (int, optional): Number of retries after the first attempt. Defaults to 3.
+            backoff (float, optional): Base delay in seconds between retries. Defaults to 0.5.
+            window (int, optional): Number of recent deliveries kept for latency metrics. Defaults to 200.
+        """
+        self.log = Log.get("notify")
+        self._client = client
+        self.retries = retries
+        self.backoff = backoff
+        self.tasks = set()
+        self.latencies = deque(maxlen=window)
+        self.delivered = 0
+        self.failed = 0
+
+    @property
+    def client(self):
+        """
+        The connection pool, the shared api tier unless one was given.
+        """
+        return self._client if self._client is not None else api_client.get()
+
+    def push(self, receiver, body):
+        """
+        Schedule a push to the receiver and return immediately.
+
+        Args:
+            receiver (str): The name of the receiver in cfg["bark"].
+            body (str): The body of the notification.
+
+        Returns:
+            asyncio.Task: The delivery task, resolving to whether the push was delivered.
+        """
+        task = asyncio.create_task(self.send(receiver, body))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def send(self, receiver, body):
+        try:
+            url = cfg["bark"][receiver]
+            data = dict(cfg["bark"]["post"], body=body)
+        except KeyError as e:
+            self.failed += 1
+            metrics.inc("bark_failed_total")
+            self.log.error(f"no bark config for {receiver}: {e}")
+            return False
+        return await self.deliver(url, data)
+
+    async def deliver(self, url, data):
+        """
+        Deliver a push, retrying transport errors, 429 and 5xx responses.
+
+        Any other error is logged and counted as a failure, never raised, since
+        the delivery runs in a task nobody awaits.
+
+        Args:
+            url (str): The Bark url of the receiver.
+            data (dict): The form data to post.
+
+        Returns:
+            bool: Whether the push was delivered.
+        """
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                r = await self.client.post(url=url, data=data)
+                if r.status_code != 429 and r.status_code < 500:
+                    r.raise_for_status()
+                    break
+                error = f"status {r.status_code}"
+            except httpx.HTTPStatusError as e:
+                self.failed += 1
+                metrics.inc("bark_failed_total")
+                self.log.error(f"push rejected: {e}")
+                return False
+            except httpx.TransportError as e:
+                error = repr(e)
+            except Exception as e:
+                self.failed += 1
+                metrics.inc("bark_failed_total")
+                self.log.error(f"push failed: {e!r}")
+                return False
+            if attempt == self.retries:
+                self.failed += 1
+                metrics.inc("bark_failed_total")
+                self.log.error(f"push failed after {attempt + 1} attempts: {error}")
+                return False
+            await asyncio.sleep(self.backoff * 2**attempt)
+        latency = time.perf_counter() - start
+        self.delivered += 1
+        self.latencies.append(latency)
+        metrics.observe("http_request_seconds", latency, target="bark", status="ok")
+        return True
+
+    def stats(self):
+        """
+        Get the delivery metrics and publish them as gauges.
+
+        Returns:
+            dict: Delivered and failed counts, and p50/p95/max latency in seconds over the recent window.
+        """
+        latencies = sorted(self.latencies)
+
+        def pick(q):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+        stats = {
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "pending": len(self.tasks),
+            "p50": pick(0.5),
+            "p95": pick(0.95),
+            "max": latencies[-1] if latencies else None,
+        }
+        for name, value in stats.items():
+            if value is not None:
+                metrics.set(f"bark_{name}", value)
+        return stats
+
+    async def close(self):
+        """
+        Wait for the pending pushes and close a connection pool that was given.
+        """
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+
+
+notifier = Notifier()
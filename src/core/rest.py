@@ -0,0 +1,132 @@
+"""
+contains the priority scheduling of Discord REST requests
+"""
+
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from src.core.init import Log
+from src.core.metrics import metrics
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+priority = ContextVar("priority", default=INTERACTIVE)
+
+
+class PressureHandler(logging.Handler):
+    """
+    Log handler that pauses bulk requests for the waits announced on 429.
+    """
+
+    def __init__(self, scheduler):
+        super().__init__(level=logging.WARNING)
+        self.scheduler = scheduler
+
+    def emit(self, record):
+        if str(record.msg).startswith("We are being rate limited") and record.args:
+            self.scheduler.pause_bulk(float(record.args[0]))
+
+
+class RestScheduler:
+    """
+    Gate in front of the bot's HTTP client with two priority classes.
+
+    Interactive requests go straight through. Bulk requests, marked with bulk(),
+    run a few at a time, wait while any interactive request is in flight and
+    back off while Discord reports rate limiting. Every application command
+    starts interactive. Interaction responses and followups are sent through
+    the webhook adapter rather than the bot's HTTP client, so they never wait
+    behind the gate.
+    """
+
+    def __init__(self, bulk_concurrency=2):
+        """
+        Initialize the RestScheduler object.
+
+        Args:
+            bulk_concurrency (int, optional): Max number of bulk requests in flight. Defaults to 2.
+        """
+        self.log = Log.get("rest")
+        self.bulk_slots = asyncio.Semaphore(bulk_concurrency)
+        self.interactive_active = 0
+        self.interactive_idle = asyncio.Event()
+        self.interactive_idle.set()
+        self.paused_until = 0.0
+
+    @staticmethod
+    @contextmanager
+    def bulk():
+        """
+        Mark the requests made in the block, and in tasks created from it, as bulk.
+        """
+        token = priority.set(BULK)
+        try:
+            yield
+        finally:
+            priority.reset(token)
+
+    def pause_bulk(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    @staticmethod
+    async def mark_interactive(ctx):
+        # runs in the task of the command, so it holds for the whole invocation
+        priority.set(INTERACTIVE)
+
+    async def run_interactive(self, call):
+        self.interactive_active += 1
+        self.interactive_idle.clear()
+        try:
+            return await call()
+        finally:
+            self.interactive_active -= 1
+            if not self.interactive_active:
+                self.interactive_idle.set()
+
+    async def run_bulk(self, call):
+        async with self.bulk_slots:
+            while True:
+                await self.interactive_idle.wait()
+                delay = self.paused_until - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                if self.interactive_idle.is_set():
+                    break
+            return await call()
+
+    def install(self, bot):
+        """
+        Route every request of the bot through the scheduler and mark its commands as interactive.
+
+        Args:
+            bot (discord.Bot): The bot to schedule.
+        """
+        http = bot.http
+        request = http.request
+
+        async def scheduled_request(route, **kwargs):
+            cls = priority.get()
+            queued = time.perf_counter()
+
+            async def call():
+                metrics.observe(
+                    "rest_queue_wait_seconds",
+                    time.perf_counter() - queued,
+                    priority=cls,
+                )
+                return await request(route, **kwargs)
+
+            if cls == BULK:
+                return await self.run_bulk(call)
+            return await self.run_interactive(call)
+
+        http.request = scheduled_request
+        bot.before_invoke(self.mark_interactive)
+        logging.getLogger("discord.http").addHandler(PressureHandler(self))
+
+
+rest = RestScheduler()
@@ -0,0 +1,211 @@
+"""
+contains the activity rollups kept next to the local mirror
+"""
+
+from src.core.init import cfg, bot, Log
+from src.core.directory import directory
+from src.core.mirror import mirror
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    hour INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    author_id INTEGER NOT NULL,
+    messages INTEGER NOT NULL,
+    attachments INTEGER NOT NULL,
+    links INTEGER NOT NULL,
+    PRIMARY KEY (hour, channel_id, author_id)
+);
+CREATE TRIGGER IF NOT EXISTS rollup_insert AFTER INSERT ON messages
+WHEN NEW.deleted = 0 BEGIN
+    INSERT INTO rollups VALUES (
+        CAST(NEW.created_at / 3600 AS INTEGER),
+        NEW.channel_id,
+        NEW.author_id,
+        1,
+        json_array_length(NEW.attachments),
+        NEW.content LIKE '%http://%' OR NEW.content LIKE '%https://%'
+    )
+    ON CONFLICT (hour, channel_id, author_id) DO UPDATE SET
+        messages = messages + 1,
+        attachments = attachments + excluded.attachments,
+        links = links + excluded.links;
+END;
+CREATE TRIGGER IF NOT EXISTS rollup_delete AFTER DELETE ON messages
+WHEN OLD.deleted = 0 BEGIN
+    UPDATE rollups SET
+        messages = messages - 1,
+        attachments = attachments - json_array_length(OLD.attachments),
+        links = links - (OLD.content LIKE '%http://%' OR OLD.content LIKE '%https://%')
+    WHERE hour = CAST(OLD.created_at / 3600 AS INTEGER)
+        AND channel_id = OLD.channel_id AND author_id = OLD.author_id;
+END;
+CREATE TRIGGER IF NOT EXISTS rollup_soft_delete AFTER UPDATE OF deleted ON messages
+WHEN OLD.deleted = 0 AND NEW.deleted = 1 BEGIN
+    UPDATE rollups SET
+        messages = messages - 1,
+        attachments = attachments - json_array_length(OLD.attachments),
+        links = links - (OLD.content LIKE '%http://%' OR OLD.content LIKE '%https://%')
+    WHERE hour = CAST(OLD.created_at / 3600 AS INTEGER)
+        AND channel_id = OLD.channel_id AND author_id = OLD.author_id;
+END;
+"""
+
+BUILD = """
+INSERT INTO rollups
+SELECT
+    CAST(created_at / 3600 AS INTEGER),
+    channel_id,
+    author_id,
+    COUNT(*),
+    SUM(json_array_length(attachments)),
+    SUM(content LIKE '%http://%' OR content LIKE '%https://%')
+FROM messages WHERE deleted = 0
+GROUP BY 1, 2, 3
+"""
+
+# rollups keyed by display name, before they were keyed by author id
+DROP_NAME_KEYED = """
+DROP TRIGGER IF EXISTS rollup_insert;
+DROP TRIGGER IF EXISTS rollup_delete;
+DROP TRIGGER IF EXISTS rollup_soft_delete;
+DROP TABLE IF EXISTS rollups;
+"""
+
+# SQL of each grouping, over the local time in seconds as "local"
+GROUPS = {
+    "author": "author_id",
+    "channel": "channel_id",
+    "day": "date(local, 'unixepoch')",
+    "month": "strftime('%Y-%m', local, 'unixepoch')",
+    "hour": "strftime('%H', local, 'unixepoch')",
+    "weekday": "strftime('%w', local, 'unixepoch')",
+}
+WEEKDAYS = ["日", "一", "二", "三", "四", "五", "六"]
+# groupings whose rows are sorted by their counts rather than by their keys
+RANKED = {"author", "channel"}
+
+
+class Rollups:
+    """
+    Hourly message, attachment and link counts per channel and author.
+
+    The counts live in the mirror database and are kept by triggers on its
+    messages table, so every create, replace and delete recorded by the mirror
+    updates them exactly once. They are built from the mirrored history the
+    first time, then any date range is answered from at most one row per hour,
+    channel and author instead of the messages. Authors are keyed by id, so
+    renames do not split their counts, and named when a report is made.
+    """
+
+    def __init__(self):
+        """
+        Initialize the Rollups object.
+        """
+        self.log = Log.get("rollup")
+        self.db = None
+
+    def open(self):
+        """
+        Create the rollup table and triggers, building the table on first use.
+        """
+        if self.db is not None or not mirror.enabled:
+            return
+        mirror.open()
+        db = mirror.db
+        columns = {row["name"] for row in db.execute("PRAGMA table_info(rollups)")}
+        built = "author_id" in columns
+        drop = DROP_NAME_KEYED if columns and not built else ""
+        # build and triggers in one transaction, so no message is counted twice
+        db.executescript(f"BEGIN; {drop} {SCHEMA} {'' if built else BUILD}; COMMIT;")
+        if not built:
+            total = db.execute("SELECT SUM(messages) FROM rollups").fetchone()[0]
+            self.log.info(f"built rollups of {total or 0} messages")
+        self.db = db
+
+    def query(self, groups, start, end, channel_id=None, author_id=None):
+        """
+        Sum the counts in a period, grouped by author, channel or local time.
+
+        Args:
+            groups (list): The names in GROUPS to group by, e.g. ["month", "author"].
+            start (datetime.datetime): The start of the period.
+            end (datetime.datetime): The end of the period, exclusive.
+            channel_id (int, optional): Only count this channel. Defaults to None.
+            author_id (int, optional): Only count this author. Defaults to None.
+
+        Returns:
+            list: The rows of one key per group, then messages, attachments and links.
+        """
+        offset = int(cfg["timezone"] * 3600)
+        keys = ", ".join(f"{GROUPS[group]} AS k{i}" for i, group in enumerate(groups))
+        query = (
+            f"SELECT {keys}, SUM(messages), SUM(attachments), SUM(links) "
+            "FROM (SELECT *, hour * 3600 + ? AS local FROM rollups "
+            "WHERE hour >= ? AND hour < ?"
+        )
+        params = [offset, int(start.timestamp()) // 3600, int(end.timestamp()) // 3600]
+        if channel_id is not None:
+            query += " AND channel_id = ?"
+            params.append(channel_id)
+        if author_id is not None:
+            query += " AND author_id = ?"
+            params.append(author_id)
+        # rows of the same author or channel stay together, time keys in order
+        order = [f"k{i}" for i, group in enumerate(groups[:-1])]
+        if groups[-1] in RANKED:
+            order.append(f"{len(groups) + 1} DESC")
+        else:
+            order.append(f"k{len(groups) - 1}")
+        by = ", ".join(f"k{i}" for i in range(len(groups)))
+        query += f") GROUP BY {by} HAVING SUM(messages) > 0 ORDER BY {', '.join(order)}"
+        return self.db.execute(query, params).fetchall()
+
+    def author_name(self, author_id):
+        """
+        Name an author by their current display name, else their latest mirrored one.
+        """
+        guild = bot.get_guild(cfg["guild_id"])
+        member = guild.get_member(author_id) if guild else None
+        if member is None:
+            member = directory.members.get(author_id)
+        if member is not None:
+            return member.display_name
+        row = self.db.execute(
+            "SELECT author_name FROM messages WHERE author_id = ? ORDER BY id DESC LIMIT 1",
+            (author_id,),
+        ).fetchone()
+        return row[0] if row else str(author_id)
+
+    def label(self, group, key, names):
+        if group == "author":
+            if key not in names:
+                names[key] = self.author_name(key)
+            return names[key]
+        if group == "channel":
+            return f"#{directory.channel_names.get(key, key)}"
+        if group == "weekday":
+            return f"周{WEEKDAYS[int(key)]}"
+        if group == "hour":
+            return f"{key}:00"
+        return key
+
+    def report(self, groups, start, end, channel_id=None, author_id=None):
+        """
+        Format the counts in a period as lines.
+
+        Returns:
+            list: One line per key.
+        """
+        lines = []
+        names = {}
+        for row in self.query(groups, start, end, channel_id, author_id):
+            *keys, messages, attachments, links = row
+            key = " ".join(
+                str(self.label(group, k, names)) for group, k in zip(groups, keys)
+            )
+            lines.append(f"{key}: {messages}条 {attachments}附件 {links}链接")
+        return lines
+
+
+rollups = Rollups()
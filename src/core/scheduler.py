@@ -0,0 +1,201 @@
+"""
+contains the scheduler of the daily jobs
+"""
+
+import os
+import json
+import time
+import asyncio
+from datetime import datetime, timedelta
+from src.core.init import cfg, tz, Log
+from src.core.metrics import metrics
+
+# kept in the backup folder, which is persisted, unlike the working directory
+STATE_FILE = ".scheduler.json"
+
+
+class Job:
+    """
+    A job that is due once a day at a fixed local time.
+    """
+
+    def __init__(self, name, func, at, catch_up_all=False, max_catch_up=7):
+        """
+        Initialize the Job object.
+
+        Args:
+            name (str): The name of the job.
+            func (coroutine function): Called with the due datetime of the run.
+            at (datetime.time): The local time the job is due every day.
+            catch_up_all (bool, optional): Whether to run every missed day or only the latest. Defaults to False.
+            max_catch_up (int, optional): Max number of missed days to run. Defaults to 7.
+        """
+        self.name = name
+        self.func = func
+        self.at = at
+        self.catch_up_all = catch_up_all
+        self.max_catch_up = max_catch_up
+        self.running = False
+
+    def due_times(self, last_run, now):
+        """
+        Get the due times that have not run yet, oldest first.
+
+        Args:
+            last_run (datetime.datetime): The due time of the last run, or None.
+            now (datetime.datetime): The current time.
+
+        Returns:
+            list: The due datetimes to run.
+        """
+        latest = datetime.combine(now.date(), self.at, tzinfo=tz)
+        if latest > now:
+            latest -= timedelta(days=1)
+        if last_run is None or latest <= last_run:
+            return []
+        dues = [latest]
+        while self.catch_up_all and len(dues) < self.max_catch_up:
+            previous = dues[-1] - timedelta(days=1)
+            if previous <= last_run:
+                break
+            dues.append(previous)
+        return dues[::-1]
+
+
+class Scheduler:
+    """
+    Scheduler of daily jobs with persisted last runs.
+
+    Missed runs are caught up after a restart, a job never overlaps with itself
+    and different jobs run in parallel. The last run, status and duration of
+    every job are kept in a state file.
+    """
+
+    def __init__(self):
+        """
+        Initialize the Scheduler object.
+        """
+        self.log = Log.get("scheduler")
+        self.jobs = {}
+        self.state = None
+        self.tasks = set()
+        self.on_error = None
+
+    @property
+    def state_file(self):
+        state_file = cfg.get("scheduler", {}).get("state_file")
+        return state_file or os.path.join(cfg["backup"]["local_folder"], STATE_FILE)
+
+    def add(self, job):
+        self.jobs[job.name] = job
+
+    def load(self):
+        """
+        Load the state file, starting every unknown job from its latest due time.
+        """
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+        now = datetime.now(tz)
+        for job in self.jobs.values():
+            if job.name not in self.state:
+                latest = datetime.combine(now.date(), job.at, tzinfo=tz)
+                if latest > now:
+                    latest -= timedelta(days=1)
+                self.state[job.name] = {"last_run": latest.isoformat()}
+        self.save()
+
+    def save(self):
+        tmp = f"{self.state_file}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.state_file)
+
+    def last_run(self, job):
+        last_run = self.state.get(job.name, {}).get("last_run")
+        return datetime.fromisoformat(last_run) if last_run else None
+
+    def tick(self):
+        """
+        Start every job that is due and not running.
+        """
+        if self.state is None:
+            self.load()
+        now = datetime.now(tz)
+        for job in self.jobs.values():
+            if job.running:
+                continue
+            dues = job.due_times(self.last_run(job), now)
+            if not dues:
+                continue
+            job.running = True
+            task = asyncio.create_task(self.run(job, dues))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def run(self, job, dues):
+        """
+        Run a job for each due time and record the outcome.
+
+        Args:
+            job (Job): The job to run.
+            dues (list): The due datetimes, oldest first.
+        """
+        try:
+            for due in dues:
+                self.log.info(f"running {job.name} due {due.isoformat()}")
+                start = time.perf_counter()
+                status = None
+                try:
+                    async with metrics.timer("job_seconds", job=job.name):
+                        await job.func(due)
+                    status = "ok"
+                except Exception as e:
+                    status = f"error: {e}"
+                    self.log.error(f"{job.name} failed: {e}")
+                    if self.on_error:
+                        try:
+                            await self.on_error(job, e)
+                        except Exception as report_error:
+                            self.log.error(
+                                f"failed to report the failure of {job.name}: {report_error}"
+                            )
+                finally:
+                    duration = time.perf_counter() - start
+                    # an interrupted run, e.g. at shutdown, is caught up after the restart
+                    last_run = self.last_run(job) if status is None else due
+                    status = status or "interrupted"
+                    self.state[job.name] = {
+                        "last_run": last_run.isoformat() if last_run else None,
+                        "status": status,
+                        "duration": round(duration, 3),
+                        "finished_at": datetime.now(tz).isoformat(),
+                    }
+                    self.save()
+                self.log.info(f"{job.name} {status} in {duration:.2f}s")
+        finally:
+            job.running = False
+
+    def report(self):
+        """
+        Report the last run, status and duration of every job.
+
+        Returns:
+            list: One line per job.
+        """
+        if self.state is None:
+            self.load()
+        lines = []
+        for name, job in self.jobs.items():
+            state = self.state.get(name, {})
+            running = " (running)" if job.running else ""
+            lines.append(
+                f"{name}{running}: {state.get('status', '-')} "
+                f"{state.get('duration', '-')}s, due {state.get('last_run', '-')}"
+            )
+        return lines
+
+
+scheduler = Scheduler()
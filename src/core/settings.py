@@ -0,0 +1,209 @@
+"""
+contains the compiled and hot-reloadable view of the config
+"""
+
+import os
+import re
+from types import MappingProxyType
+from typing import NamedTuple
+import yaml
+from src.core.init import cfg, CONFIG_PATH, Log
+
+# keys filled at runtime by the directory, kept across reloads
+RUNTIME_KEYS = ["channel", "member"]
+BOARD_KEYS = ["channel", "unit_1", "unit_10", "title", "response"]
+# the amount line of a board message
+BOARD_AMOUNT = re.compile(r"\n([-0-9]+)")
+
+
+class Board(NamedTuple):
+    channel: str | int
+    unit_1: str
+    unit_10: str
+    title: str
+    response: str
+    unit_1_pattern: re.Pattern
+
+
+def mapping(value, name):
+    if not isinstance(value, dict):
+        raise ValueError(f"{name} must be a mapping")
+    return value
+
+
+def strings(value, name):
+    # a bare string would be iterated character by character
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise ValueError(f"{name} must be a list of strings")
+    return value
+
+
+class Snapshot:
+    """
+    Immutable, validated and precompiled view of one version of the config.
+    """
+
+    __slots__ = [
+        "raw",
+        "archive_keyword",
+        "archive_embed",
+        "board",
+    ]
+
+    def __init__(self, raw):
+        """
+        Validate and compile the raw config.
+
+        Args:
+            raw (dict): The raw config.
+
+        Raises:
+            ValueError: If the config is invalid.
+        """
+        for key in ["guild_id", "timezone", "archive_keyword", "archive_embed", "board"]:
+            if key not in raw:
+                raise ValueError(f"missing config key: {key}")
+        archive_keyword = []
+        for channel, keywords in mapping(raw["archive_keyword"], "archive_keyword").items():
+            strings(keywords, f"archive_keyword.{channel}")
+            if not keywords:
+                raise ValueError(f"archive_keyword.{channel} has no keywords")
+            try:
+                archive_keyword.append((channel, re.compile("|".join(keywords))))
+            except re.error as e:
+                raise ValueError(f"archive_keyword.{channel} is invalid: {e}") from e
+        archive_embed = []
+        for channel, urls in mapping(raw["archive_embed"], "archive_embed").items():
+            archive_embed.append((channel, tuple(strings(urls, f"archive_embed.{channel}"))))
+        board = {}
+        for giver, info in mapping(raw["board"], "board").items():
+            mapping(info, f"board.{giver}")
+            missing = [key for key in BOARD_KEYS if key not in info]
+            if missing:
+                raise ValueError(f"board.{giver} misses {', '.join(missing)}")
+            if not isinstance(info["unit_1"], str):
+                raise ValueError(f"board.{giver}.unit_1 must be a string")
+            board[giver] = Board(
+                *(info[key] for key in BOARD_KEYS),
+                unit_1_pattern=re.compile(re.escape(info["unit_1"])),
+            )
+        object.__setattr__(self, "raw", MappingProxyType(raw))
+        object.__setattr__(self, "archive_keyword", tuple(archive_keyword))
+        object.__setattr__(self, "archive_embed", tuple(archive_embed))
+        object.__setattr__(self, "board", MappingProxyType(board))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Snapshot is immutable")
+
+    def route_keyword(self, content):
+        """
+        Find the archive channel of a message by its keywords.
+
+        Args:
+            content (str): The message content.
+
+        Returns:
+            str | int: The channel reference, or None.
+        """
+        for channel, pattern in self.archive_keyword:
+            if pattern.search(content):
+                return channel
+        return None
+
+    def route_embed(self, content):
+        """
+        Find the archive channel of a message by the urls in it.
+
+        Args:
+            content (str): The message content.
+
+        Returns:
+            str | int: The channel reference, or None.
+        """
+        # the first channel with a matching url wins, as listed in the config
+        for channel, urls in self.archive_embed:
+            if any(url in content for url in urls):
+                return channel
+        return None
+
+
+class Settings:
+    """
+    Holder of the current config snapshot.
+
+    Reloads validate and compile the file first and then swap the snapshot and the
+    legacy cfg dict in one step, so a bad file never replaces a working config.
+    """
+
+    def __init__(self):
+        """
+        Initialize the Settings object.
+        """
+        self.log = Log.get("settings")
+        self._current = None
+        self.mtime = None
+
+    @property
+    def current(self):
+        """
+        The current snapshot, compiled from the loaded cfg on first use.
+        """
+        if self._current is None:
+            self._current = Snapshot(dict(cfg))
+            self.mtime = self.get_mtime()
+        return self._current
+
+    @staticmethod
+    def get_mtime():
+        try:
+            return os.stat(CONFIG_PATH).st_mtime
+        except OSError:
+            return None
+
+    def reload(self):
+        """
+        Reload the config file and swap in the new snapshot.
+
+        Raises:
+            ValueError: If the new config is invalid; the current one is kept.
+        """
+        self.mtime = self.get_mtime()
+        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+            raw = yaml.safe_load(f)
+        if not isinstance(raw, dict):
+            raise ValueError("config is not a mapping")
+        snapshot = Snapshot(raw)
+        for key in RUNTIME_KEYS:
+            if key in cfg:
+                raw[key] = cfg[key]
+        # no await in between, so handlers see either the old or the new config
+        cfg.clear()
+        cfg.update(raw)
+        self._current = snapshot
+        self.log.info("config reloaded")
+
+    def check(self):
+        """
+        Reload the config if the file changed since the last load.
+
+        Returns:
+            bool: Whether a new config was swapped in.
+        """
+        if self._current is None:
+            return False
+        mtime = self.get_mtime()
+        if mtime is None or mtime == self.mtime:
+            return False
+        try:
+            self.reload()
+        except (OSError, yaml.YAMLError, ValueError) as e:
+            self.log.error(f"config reload failed, keeping the current one: {e}")
+            return False
+        except Exception:
+            # an escaping error would stop the watch loop for good
+            self.log.exception("config reload failed, keeping the current one")
+            return False
+        return True
+
+
+settings = Settings()
@@ -1,7 +1,12 @@
-import re
 from datetime import datetime, timedelta
 import discord
-from src.core.init import cfg, bot
+from src.core.init import bot
+from src.core.directory import directory
+from src.core.settings import settings, BOARD_AMOUNT
+
+# Discord limits per message
+MAX_EMBEDS = 10
+MAX_EMBED_CHARS = 6000
 
 
 def identify(message):
@@ -15,9 +20,9 @@ def identify(message):
         tuple: A tuple containing the user IDs of the identified author and the corresponding user.
                If the author is not identified, returns (None, None).
     """
-    if message.author.id == cfg["member"]["charys117"]:
+    if message.author.id == directory.member_id("charys117"):
         return "charys117", "nouvee"
-    elif message.author.id == cfg["member"]["nouvee"]:
+    elif message.author.id == directory.member_id("nouvee"):
         return "nouvee", "charys117"
     else:
         return None, None
@@ -82,16 +87,13 @@ async def modify_board(giver, quantity):
     Returns:
         int: The updated amount after modification.
     """
-    channel_name = cfg["board"][giver]["channel"]
-    unit_1 = cfg["board"][giver]["unit_1"]
-    unit_10 = cfg["board"][giver]["unit_10"]
-    title = cfg["board"][giver]["title"]
-    board_channel = bot.get_channel(cfg["channel"][channel_name])
+    info = settings.current.board[giver]
+    board_channel = directory.channel(info.channel)
     board = (await board_channel.history(limit=1).flatten())[0]
-    amount = int(re.search(r"\n[-0-9]+", board.content).group().strip("\n"))
+    amount = int(BOARD_AMOUNT.search(board.content).group(1))
     amount += quantity
-    units = format_units([unit_1, unit_10], amount)
-    new_board = f"{title}:\n{units}{amount}"
+    units = format_units([info.unit_1, info.unit_10], amount)
+    new_board = f"{info.title}:\n{units}{amount}"
     if board.author == bot.user:
         await board.edit(content=new_board)
     else:
@@ -106,7 +108,7 @@ async def daily_report(date):
     Returns:
         discord.Embed: Embed object containing the daily report.
     """
-    channel = bot.get_channel(cfg["channel"]["chat"])
+    channel = directory.channel("chat")
     daily_message_count = {}
     date_min = datetime.combine(date, datetime.min.time())
     async for message in channel.history(
@@ -0,0 +1,237 @@
+"""
+contains the backup worker process and the queue that feeds it
+"""
+
+import os
+import sys
+import json
+import asyncio
+from datetime import date
+import discord
+from src.core.init import cfg, bot, close_http_clients, load_config, Log
+from src.core.backup import BACKUP_CH, backup_by_date, format_summary
+from src.core.directory import directory
+from src.core.mirror import mirror
+from src.core.tools import warning
+
+
+class BackupWorker:
+    """
+    Local queue of backup jobs, each run in a separate worker process.
+
+    The worker logs in over REST only, with its own HTTP pools, so a long backup
+    neither blocks the gateway loop nor grows the bot's memory. Progress lines
+    from the worker are shown in one message of the invoking channel, edited in
+    place. Jobs run one at a time and the running one can be cancelled.
+    """
+
+    def __init__(self):
+        """
+        Initialize the BackupWorker object.
+        """
+        self.log = Log.get("worker")
+        self.queue = asyncio.Queue()
+        self.process = None
+        self.runner = None
+
+    @property
+    def enabled(self):
+        return cfg["backup"].get("worker", False)
+
+    async def backup(self, message=None, channel=None, start_date=None, end_date=None):
+        """
+        Back up in the worker process when enabled, in this process otherwise.
+
+        Args:
+            message: The message to respond.
+            channel: The channel to report to when there is no message.
+            start_date (datetime.date, optional): The start date. Defaults to the earliest message.
+            end_date (datetime.date, optional): The end date. Defaults to today.
+        """
+        if not self.enabled:
+            await backup_by_date(
+                message=message,
+                channel=channel,
+                start_date=start_date,
+                end_date=end_date,
+            )
+            return
+        if message:
+            await message.respond(
+                embed=discord.Embed(
+                    description=f"Backup queued, {self.queue.qsize()} job(s) ahead"
+                )
+            )
+            channel = message.channel
+        await self.submit(channel, start_date, end_date)
+
+    async def submit(self, channel, start_date=None, end_date=None):
+        """
+        Queue a backup job and wait for it to finish.
+
+        Args:
+            channel (discord.TextChannel): The channel to report to.
+            start_date (datetime.date, optional): The start date.
+            end_date (datetime.date, optional): The end date.
+
+        Raises:
+            RuntimeError: If the worker fails.
+        """
+        if self.runner is None or self.runner.done():
+            self.runner = asyncio.create_task(self.consume())
+        done = asyncio.get_running_loop().create_future()
+        job = {
+            "start_date": start_date.isoformat() if start_date else None,
+            "end_date": end_date.isoformat() if end_date else None,
+            "channel_ids": dict(directory.channel_ids),
+            "mirror": mirror.db is not None
+            and not (mirror.syncing and not mirror.syncing.done()),
+        }
+        await self.queue.put((job, channel, done))
+        await done
+
+    async def consume(self):
+        while True:
+            job, channel, done = await self.queue.get()
+            try:
+                await self.run(job, channel)
+            except Exception as e:
+                if not done.done():
+                    done.set_exception(e)
+            else:
+                if not done.done():
+                    done.set_result(None)
+            finally:
+                self.queue.task_done()
+
+    async def run(self, job, channel):
+        """
+        Run one job in a worker process and relay its progress.
+
+        Args:
+            job (dict): The job, serialized for the worker.
+            channel (discord.TextChannel): The channel to report to.
+        """
+        period = f"{job['start_date'] or 'beginning'} to {job['end_date'] or 'today'}"
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-m",
+            "src.core.worker",
+            json.dumps(job),
+            stdout=asyncio.subprocess.PIPE,
+        )
+        self.log.info(f"worker {self.process.pid} backing up {period}")
+        status = None
+        summary = None
+        count = 0
+        try:
+            async for line in self.process.stdout:
+                try:
+                    report = json.loads(line)
+                except ValueError:
+                    # a library printing to stdout, not a progress line
+                    text = line.decode(errors="replace").rstrip()
+                    self.log.warning(f"worker output: {text}")
+                    continue
+                if not isinstance(report, dict):
+                    continue
+                if "summary" in report:
+                    summary = report["summary"]
+                    continue
+                count += 1
+                text = (
+                    f"Backing up {period}: {report['progress']} "
+                    f"({count}/{len(BACKUP_CH)})"
+                )
+                try:
+                    if status is None:
+                        status = await channel.send(
+                            embed=discord.Embed(description=text)
+                        )
+                    else:
+                        await status.edit(embed=discord.Embed(description=text))
+                except discord.HTTPException as e:
+                    self.log.warning(f"progress not shown: {e}")
+        finally:
+            process, self.process = self.process, None
+            if process.returncode is None and not process.stdout.at_eof():
+                # stopped relaying early, do not leave the worker running
+                process.terminate()
+            code = await process.wait()
+        if code == 0:
+            await channel.send(
+                embed=discord.Embed(
+                    title=f"Backup from {period} finished",
+                    description=format_summary(summary) if summary else None,
+                )
+            )
+        elif code < 0:
+            await warning(f"Backup from {period} cancelled", channel=channel)
+        else:
+            await warning(
+                f"Backup from {period} failed, exit code {code}", channel=channel
+            )
+            raise RuntimeError(f"backup worker exited with {code}")
+
+    def cancel(self):
+        """
+        Terminate the running job and drop the queued ones.
+
+        Returns:
+            int: The number of jobs cancelled.
+        """
+        cancelled = 0
+        while not self.queue.empty():
+            _, _, done = self.queue.get_nowait()
+            self.queue.task_done()
+            done.set_result(None)
+            cancelled += 1
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+            cancelled += 1
+        return cancelled
+
+
+backup_worker = BackupWorker()
+
+
+async def work(job):
+    """
+    Log in over REST and run one backup job, printing a JSON line per channel.
+
+    Args:
+        job (dict): The job sent by BackupWorker.
+    """
+    directory.channel_ids.update(job["channel_ids"])
+    cfg["channel"] = directory.channel_ids
+    await bot.login(os.environ["CORTANA_TOKEN"])
+    start_date, end_date = job["start_date"], job["end_date"]
+    try:
+        await directory.fetch_channels(
+            [ch for ch in BACKUP_CH if ch in directory.channel_ids]
+        )
+        if job["mirror"] and mirror.enabled:
+            mirror.open()
+
+        async def progress(text):
+            print(json.dumps({"progress": text}), flush=True)
+
+        summary = await backup_by_date(
+            start_date=date.fromisoformat(start_date) if start_date else None,
+            end_date=date.fromisoformat(end_date) if end_date else None,
+            progress=progress,
+        )
+        print(json.dumps({"summary": summary}), flush=True)
+    finally:
+        await bot.close()
+        await close_http_clients()
+
+
+def main():
+    load_config()
+    Log.set_level("INFO")
+    asyncio.run(work(json.loads(sys.argv[1])))
+
+
+if __name__ == "__main__":
+    main()
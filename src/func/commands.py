@@ -3,14 +3,26 @@ This module contains functions that handle various commands in a Discord bot.
 """
 
 import re
+import time
 import random
 from datetime import datetime, timedelta
 import discord
 from discord.ui import Button, View, Select
-from src.core.init import cfg, bot, httpx_client, tz
+from src.core.init import cfg, bot, tz
 from src.core.cortana import cortana
-from src.core.backup import backup_by_date
+from src.core.backup import verify as verify_backup
+from src.core.badge import badge_index
+from src.core.conversation import conversations, ConversationView
+from src.core.directory import directory
+from src.core.export import export as export_channel
+from src.core.forward import Forwarder
+from src.core.metrics import metrics
+from src.core.notify import notifier
+from src.core.rollup import rollups
+from src.core.scheduler import scheduler
+from src.core.settings import settings
 from src.core.tools import identify, format_units, modify_board, warning
+from src.core.worker import backup_worker
 
 
 class Cmd:
@@ -23,12 +35,12 @@ class Cmd:
             message: The message with command
         """
         _, receiver = identify(message)
-        post = cfg["bark"]["post"].copy()
-        post["body"] = cfg["awake_notify"][receiver]
-        await httpx_client.post(url=cfg["bark"][receiver], data=post)
-        await message.respond(
-            embed=discord.Embed(description=f"已通知{receiver}您醒了")
-        )
+        delivery = notifier.push(receiver, cfg["awake_notify"][receiver])
+        await message.respond(embed=discord.Embed(description=f"正在通知{receiver}..."))
+        if await delivery:
+            await message.edit(embed=discord.Embed(description=f"已通知{receiver}您醒了"))
+        else:
+            await message.edit(embed=discord.Embed(description=f"通知{receiver}失败"))
 
     @staticmethod
     async def bonus(message):
@@ -38,7 +50,7 @@ class Cmd:
         Parameters:
         - message: The message object that triggered the command.
         """
-        bonus_ch = bot.get_channel(cfg["channel"]["bonus"])
+        bonus_ch = directory.channel("bonus")
         attr = {"number": 1, "type": "", "content": "", "reward": 0, "time": ""}
         async for m in bonus_ch.history(limit=1):
             attr["number"] = int(re.search(r"#(\d+)", m.embeds[0].title).group(1)) + 1
@@ -60,39 +72,42 @@ class Cmd:
             await rest_part(interaction)
 
         async def rest_part(interaction):
+            view.stop()
             await interaction.response.defer()
             await interaction.message.edit(content="请输入内容", view=None)
-
-            def check_func(m):
-                return m.author != bot.user and m.channel == message.channel
-
-            content = await bot.wait_for("message", check=check_func)
-            if content:
-                if content.content == "cancel":
-                    await interaction.message.edit(content="已取消")
-                    return
-                attr["content"] = content.content
-                await content.delete()
-                await interaction.message.edit(content="请输入奖励")
-                reward = await bot.wait_for("message", check=check_func)
-                try:
-                    attr["reward"] = int(reward.content)
-                except ValueError:
-                    await message.channel.send("奖励必须为整数")
-                    return
-            else:
+            content = await conversations.ask(message.channel)
+            if content is None:
+                await interaction.message.edit(content="已超时")
                 return
-            if reward and attr["type"] in ["限时悬赏", "紧急悬赏"]:
-                await reward.delete()
+            if content.content == "cancel":
+                await interaction.message.edit(content="已取消")
+                return
+            attr["content"] = content.content
+            await content.delete()
+            await interaction.message.edit(content="请输入奖励")
+            reward = await conversations.ask(message.channel)
+            if reward is None:
+                await interaction.message.edit(content="已超时")
+                return
+            try:
+                attr["reward"] = int(reward.content)
+            except ValueError:
+                await message.channel.send("奖励必须为整数")
+                return
+            await reward.delete()
+            if attr["type"] in ["限时悬赏", "紧急悬赏"]:
                 await interaction.message.edit(content="请输入时间")
-                time = await bot.wait_for("message", check=check_func)
+                time = await conversations.ask(message.channel)
+                if time is None:
+                    await interaction.message.edit(content="已超时")
+                    return
                 attr["time"] = time.content
                 await time.delete()
-            else:
-                await reward.delete()
             sender, _ = identify(message)
             # build embed
-            reward_text = format_units([cfg["board"][sender]["unit_1"]], attr["reward"])
+            reward_text = format_units(
+                [settings.current.board[sender].unit_1], attr["reward"]
+            )
             title_text = f"**悬赏#{attr['number']}**"
             description = f"类型: {attr['type']}\n内容: {attr['content']}\n"
             description += f"有效时间: {attr['time']}\n" if attr["time"] else ""
@@ -115,7 +130,7 @@ class Cmd:
             await interaction.message.edit(content="", embed=embed)
             return
 
-        view = View()
+        view = ConversationView()
         view.add_item(type1)
         view.add_item(type2)
         view.add_item(type3)
@@ -133,10 +148,18 @@ class Cmd:
             message: The message with command
         """
         _, receiver = identify(message)
-        post = cfg["bark"]["post"].copy()
-        post["body"] = "⚠️检测到戳戳⚠️检测到戳戳⚠️"
-        await httpx_client.post(url=cfg["bark"][receiver], data=post)
-        await warning(f"⚠️戳戳警报已抵达{receiver}⚠️", message=message)
+        delivery = notifier.push(receiver, "⚠️检测到戳戳⚠️检测到戳戳⚠️")
+        await message.respond(embed=discord.Embed(description=f"正在向{receiver}发送戳戳..."))
+        if await delivery:
+            await message.edit(
+                embed=discord.Embed(
+                    title="**Warning**",
+                    description=f"⚠️戳戳警报已抵达{receiver}⚠️",
+                    color=0xFFC800,
+                )
+            )
+        else:
+            await message.edit(embed=discord.Embed(description=f"戳戳未能送达{receiver}"))
 
     @staticmethod
     async def record(message, description, quantity):
@@ -151,8 +174,8 @@ class Cmd:
         # modify the board
         sender, _ = identify(message)
         amount = await modify_board(sender, quantity)
-        response = cfg["board"][sender]["response"]
-        record_channel = bot.get_channel(cfg["channel"]["record"])
+        response = settings.current.board[sender].response
+        record_channel = directory.channel("record")
         # response
         embed = discord.Embed(
             description=f"{description}{quantity:+d}\n{response}: {amount}",
@@ -172,8 +195,9 @@ class Cmd:
         Args:
             message (discord.Message): The message triggering the forward.
         """
-        night_ch = bot.get_channel(cfg["channel"]["night"])
+        night_ch = directory.channel("night")
         await message.respond(embed=discord.Embed(description="开始转发"))
+        start = None
         async for m in night_ch.history(limit=None):
             if (
                 m.author == bot.user
@@ -182,51 +206,15 @@ class Cmd:
             ):
                 start = m
                 break
-        bundle = []
-        async for m in night_ch.history(after=start, oldest_first=True):
-            if m.author == bot.user:
-                bundle += m.embeds
-                if len(bundle) >= 8:
-                    await message.channel.send(embeds=bundle)
-                    bundle = []
-            else:
-                if m.content:
-                    embed = discord.Embed(
-                        description=m.content,
-                        color=m.author.color,
-                        timestamp=m.created_at,
-                    )
-                    embed.set_author(
-                        name=m.author.display_name, icon_url=m.author.avatar.url
-                    )
-                    bundle.append(embed)
-                for att in m.attachments:
-                    if att.content_type.startswith("image"):
-                        embed = discord.Embed(
-                            color=m.author.color, timestamp=m.created_at
-                        )
-                        embed.set_author(
-                            name=m.author.display_name, icon_url=m.author.avatar.url
-                        )
-                        embed.set_image(url=att.url)
-                        bundle.append(embed)
-                    elif att.content_type.startswith("video"):
-                        if bundle:
-                            await message.channel.send(embeds=bundle)
-                            bundle = []
-                        await message.channel.send(att.url)
-                    if len(bundle) >= 8:
-                        await message.channel.send(embeds=bundle)
-                        bundle = []
-                if len(bundle) >= 8:
-                    await message.channel.send(embeds=bundle)
-                    bundle = []
-        if bundle:
-            await message.channel.send(embeds=bundle)
+        forwarded, sent, rate = await Forwarder(night_ch, message.channel).run(start)
         await night_ch.send(
             embed=discord.Embed(description=f"已转发到<#{message.channel.id}>")
         )
-        await message.channel.send(embed=discord.Embed(description="转发结束"))
+        await message.channel.send(
+            embed=discord.Embed(
+                description=f"转发结束: {forwarded}条消息, {sent}次发送, {rate:.2f}条/秒"
+            )
+        )
 
     @staticmethod
     async def done(message, index):
@@ -240,7 +228,7 @@ class Cmd:
         await message.defer()
         sender, receiver = identify(message)
         giver = receiver
-        bonus_ch = bot.get_channel(cfg["channel"]["bonus"])
+        bonus_ch = directory.channel("bonus")
         succuess_emoji = ["🎉", "🎊", "🥳", "🍾", "💐"]
         succuess_emoji = random.choice(succuess_emoji)
         async for m in bonus_ch.history(limit=None):
@@ -255,8 +243,9 @@ class Cmd:
                     await warning("该悬赏之前已完成, 请重新确认", message=message)
                     return
                 await m.unpin()
-                reward_emoji = cfg["board"][giver]["unit_1"]
-                reward = len(re.compile(reward_emoji).findall(content))
+                board = settings.current.board[giver]
+                reward_emoji = board.unit_1
+                reward = len(board.unit_1_pattern.findall(content))
                 new_content = (
                     f"~~{content.split('状态')[0]}~~状态: 已完成{succuess_emoji}"
                 )
@@ -264,14 +253,14 @@ class Cmd:
                 embed.description = new_content
                 await m.edit(embed=embed)
                 amount = await modify_board(giver, reward)
-                response = cfg["board"][giver]["response"]
+                response = board.response
                 congrat_embed = discord.Embed(
                     title="**CONGRATULATIONS!!**",
                     description=f"悬赏{index}已完成{succuess_emoji}\n恭喜<@{cfg['user'][sender]}>获得{reward_emoji}x{reward}\n{response}: {amount}",
                 )
                 await message.respond(embed=congrat_embed)
                 # response
-                await bot.get_channel(cfg["channel"]["record"]).send(embed=embed)
+                await directory.channel("record").send(embed=embed)
                 return
 
     @staticmethod
@@ -293,8 +282,8 @@ class Cmd:
                 if new_disname == cfg["cortana"][name]["display_name"]:
                     new_name = name
                     break
-            await cortana.shift(new_name)
             await interaction.response.defer()
+            await cortana.shift(new_name)
             embed = discord.Embed(
                 description=cortana.get_lyric("online"), color=cortana.color
             )
@@ -342,9 +331,9 @@ class Cmd:
 
         # interactions to define badge
         badge = {}
-        badge_channel = bot.get_channel(cfg["channel"]["badge"])
+        badge_channel = directory.channel("badge")
         sender, receiver = identify(message)
-        badge["owner"] = bot.get_user(cfg["member"][receiver])
+        badge["owner"] = await directory.fetch_member(receiver)
         func_cfg = cfg["award"][sender]
         titles = list(func_cfg)
         title1 = Button(label=titles[0], style=discord.ButtonStyle.green)
@@ -372,7 +361,7 @@ class Cmd:
             badge["color"] = func_cfg[title][1]
             await rest_part(interaction)
 
-        view = View()
+        view = ConversationView()
         view.add_item(title1)
         view.add_item(title2)
         view.add_item(title3)
@@ -382,6 +371,7 @@ class Cmd:
         await message.respond("请选择称号", view=view)
 
         async def rest_part(interaction):
+            view.stop()
             await interaction.response.defer()
             # build embed
             embed = discord.Embed(
@@ -393,19 +383,120 @@ class Cmd:
             # reply
             await interaction.channel.send(content="已授予", embed=embed)
             await interaction.message.edit(content="已完成", view=None)
-            # find the message
-            aim_message = None
-            async for i in badge_channel.history(limit=None):
-                if str(badge["owner"].id) in i.embeds[0].footer.icon_url:
-                    aim_message = i
-                    break
-            if not aim_message:
-                await badge_channel.send(embed=embed)
-            else:
-                embeds = aim_message.embeds
-                embeds.append(embed)
-                await aim_message.edit(embeds=embeds)
+            # append to the owner's badge message
+            await badge_index.add(badge_channel, badge["owner"].id, embed)
+            return
+
+    @staticmethod
+    async def reload_config(message):
+        """
+        Reload config.yml without restarting.
+
+        Args:
+            message (discord.Message): The message triggering the command.
+        """
+        try:
+            settings.reload()
+        except Exception as e:
+            await warning(f"配置重载失败: {e}", message=message)
+            return
+        await message.respond(embed=discord.Embed(description="配置已重载"))
+
+    @staticmethod
+    async def dump_metrics(message):
+        """
+        Dump the metrics to the log, with the Bark delivery stats.
+
+        Args:
+            message (discord.Message): The message triggering the command.
+        """
+        bark = notifier.stats()
+        metrics.dump()
+        latency = (
+            f"p50 {bark['p50'] * 1000:.0f}ms, p95 {bark['p95'] * 1000:.0f}ms, max {bark['max'] * 1000:.0f}ms"
+            if bark["max"] is not None
+            else "no deliveries yet"
+        )
+        await message.respond(
+            embed=discord.Embed(
+                description=(
+                    "监控指标已输出到日志\n"
+                    f"Bark: {bark['delivered']} delivered, {bark['failed']} failed, "
+                    f"{bark['pending']} pending, {latency}"
+                )
+            )
+        )
+
+    @staticmethod
+    async def jobs(message):
+        """
+        Reports the last run of the scheduled jobs.
+
+        Args:
+            message (discord.Message): The message triggering the command.
+        """
+        await message.respond(
+            embed=discord.Embed(
+                title="**Jobs**", description="\n".join(scheduler.report())
+            )
+        )
+
+    @staticmethod
+    async def stats(
+        message,
+        group,
+        start_date_str,
+        end_date_str=None,
+        channel=None,
+        then=None,
+        author=None,
+    ):
+        """
+        Reports the activity in a period from the rollups.
+
+        Args:
+            message (discord.Message): The message triggering the command.
+            group (str): What to group by: author, channel, day, month, hour or weekday.
+            start_date_str (str): The first day of the period, in the format 'yymmdd'.
+            end_date_str (str, optional): The day after the period, in the format 'yymmdd'. Defaults to tomorrow.
+            channel (discord.TextChannel, optional): Only count this channel. Defaults to None.
+            then (str, optional): What to group by within each group, e.g. author per month. Defaults to None.
+            author (discord.Member, optional): Only count this author. Defaults to None.
+        """
+        if rollups.db is None:
+            await warning("统计不可用, 需要启用mirror", message=message)
             return
+        start = datetime.strptime(start_date_str, "%y%m%d").replace(tzinfo=tz)
+        end = (
+            datetime.strptime(end_date_str, "%y%m%d").replace(tzinfo=tz)
+            if end_date_str
+            else datetime.combine(datetime.now(tz).date(), datetime.min.time(), tz)
+            + timedelta(days=1)
+        )
+        started = time.perf_counter()
+        groups = [group] if then in (None, group) else [group, then]
+        lines = rollups.report(
+            groups,
+            start,
+            end,
+            channel.id if channel else None,
+            author.id if author else None,
+        )
+        elapsed = (time.perf_counter() - started) * 1000
+        description = ""
+        for line in lines:
+            if len(description) + len(line) > 4000:
+                description += "…"
+                break
+            description += line + "\n"
+        scope = f"#{channel.name} " if channel else ""
+        scope += f"@{author.display_name} " if author else ""
+        embed = discord.Embed(
+            title=f"**{scope}{start:%y%m%d}-{end:%y%m%d} by {' and '.join(groups)}**",
+            description=description or "无记录",
+        )
+        embed.set_footer(text=f"{elapsed:.1f}ms")
+        await message.respond(embed=embed)
 
     @staticmethod
     async def backup_daily(message):
@@ -416,7 +507,7 @@ class Cmd:
             message (discord.Message): The message triggering the command.
         """
         today = datetime.now(tz).date()
-        await backup_by_date(
+        await backup_worker.backup(
             message=message, start_date=today - timedelta(days=1), end_date=today
         )
 
@@ -438,4 +529,48 @@ class Cmd:
         end_date = (
             datetime.strptime(end_date_str, "%y%m%d").date() if end_date_str else None
         )
-        await backup_by_date(message=message, start_date=start_date, end_date=end_date)
+        await backup_worker.backup(
+            message=message, start_date=start_date, end_date=end_date
+        )
+
+    @staticmethod
+    async def export(message, channel, start_date_str, end_date_str):
+        """
+        Export the messages of a channel in a period as a zip.
+
+        Args:
+            message (discord.Message): The message triggering the command.
+            channel (discord.TextChannel): The channel to export.
+            start_date_str (str): The first day of the period, in the format 'yymmdd'.
+            end_date_str (str): The day after the period, in the format 'yymmdd'.
+        """
+        start_date = datetime.strptime(start_date_str, "%y%m%d").date()
+        end_date = (
+            datetime.strptime(end_date_str, "%y%m%d").date() if end_date_str else None
+        )
+        await export_channel(message, channel, start_date, end_date)
+
+    @staticmethod
+    async def verify(message, repair, adopt):
+        """
+        Verify the backup folder and download broken attachments again.
+
+        Args:
+            message (discord.Message): The message triggering the command.
+            repair (bool): Whether to download broken attachments again.
+            adopt (bool): Whether to record the orphaned files as they are.
+        """
+        await verify_backup(message, repair, adopt)
+
+    @staticmethod
+    async def backup_cancel(message):
+        """
+        Cancel the running backup and the queued ones.
+
+        Args:
+            message (discord.Message): The message triggering the command.
+        """
+        cancelled = backup_worker.cancel()
+        await message.respond(
+            embed=discord.Embed(description=f"Cancelled {cancelled} backup job(s)")
+        )
@@ -2,14 +2,16 @@
 Contains functions that are used in the main bot file.
 """
 
-import re
 import asyncio
-from datetime import datetime, timedelta
+from datetime import timedelta
 import discord
-from src.core.init import cfg, bot, tz
+from src.core.init import cfg
 from src.core.cortana import cortana
-from src.core.backup import backup_by_date
+from src.core.dedup import archive_index
+from src.core.directory import directory
+from src.core.settings import settings
 from src.core.tools import warning, daily_report
+from src.core.worker import backup_worker
 
 
 class Func:
@@ -21,23 +23,31 @@ class Func:
         Args:
             message (discord.Message): The message to be archived.
         """
-        for channel_name, keyword in cfg["archive_keyword"].items():
-            if re.search("|".join(keyword), message.content):
-                channel = bot.get_channel(cfg["channel"][channel_name])
-                if "video" in message.attachments[0].content_type:
-                    await channel.send(content=message.attachments[0].url)
-                else:
-                    embed = discord.Embed(
-                        description=message.content, color=message.author.color
-                    )
-                    embed.set_author(
-                        name=message.author.display_name,
-                        icon_url=message.author.avatar.url,
-                    )
-                    embed.set_image(url=message.attachments[0].url)
-                    await channel.send(embed=embed)
-                await message.add_reaction(cortana.get_emoji())
+        channel_name = settings.current.route_keyword(message.content)
+        if channel_name is None:
+            return
+        att = message.attachments[0]
+        if archive_index.enabled:
+            repeat, fingerprint = await archive_index.check(att)
+            if repeat is not None:
+                await message.add_reaction(archive_index.emoji)
                 return
+        channel = directory.channel(channel_name)
+        if "video" in att.content_type:
+            await channel.send(content=att.url)
+        else:
+            embed = discord.Embed(
+                description=message.content, color=message.author.color
+            )
+            embed.set_author(
+                name=message.author.display_name,
+                icon_url=message.author.avatar.url,
+            )
+            embed.set_image(url=att.url)
+            await channel.send(embed=embed)
+        if archive_index.enabled:
+            archive_index.add(att, fingerprint, channel_name)
+        await message.add_reaction(cortana.get_emoji())
 
     @staticmethod
     async def archive_embed(message):
@@ -47,44 +57,55 @@ class Func:
         Args:
             message (discord.Message): The message containing the embedded content.
         """
-        for k, i in cfg["archive_embed"].items():
-            if any(url in message.content for url in i):
-                times = 0
-                while not message.embeds:
-                    times += 1
-                    await asyncio.sleep(1)
-                    if times == 5:
-                        await warning("自动embed失败", message=message)
-                        return
-                await message.guild.get_channel(cfg["channel"][k]).send(
-                    embed=message.embeds[0]
-                )
-                await message.add_reaction(cortana.get_emoji())
+        channel_name = settings.current.route_embed(message.content)
+        if channel_name is None:
+            return
+        times = 0
+        while not message.embeds:
+            times += 1
+            await asyncio.sleep(1)
+            if times == 5:
+                await warning("自动embed失败", message=message)
                 return
+        await directory.channel(channel_name).send(embed=message.embeds[0])
+        await message.add_reaction(cortana.get_emoji())
 
     @staticmethod
-    async def daily():
-        ch_name = cfg["daily"]["channel"]
-        channel = bot.get_channel(cfg["channel"][ch_name])
+    async def greeting(due):
+        """
+        Shifts to a random identity and sends the report of the day before the due time.
+
+        Args:
+            due (datetime.datetime): The due time of the run.
+        """
+        channel = directory.channel(cfg["daily"]["channel"])
         shift_embed = discord.Embed(
             description=cortana.get_lyric("offline"), color=cortana.color
         )
         shift_embed = shift_embed.set_author(
             name=cortana.member.display_name, icon_url=cortana.member.avatar.url
         )
-        await cortana.random_change()
+        _, daily_embed = await asyncio.gather(
+            cortana.random_change(), daily_report(due.date() - timedelta(days=1))
+        )
         online_embed = discord.Embed(
             description=cortana.get_lyric("online"), color=cortana.color
         )
         online_embed = online_embed.set_author(
             name=cortana.member.display_name, icon_url=cortana.member.avatar.url
         )
-        daily_embed = await daily_report(datetime.now(tz).date() - timedelta(days=1))
         await channel.send(embeds=[shift_embed, online_embed, daily_embed])
-        today = datetime.now(tz).date()
-        try:
-            await backup_by_date(
-                channel=channel, start_date=today - timedelta(days=1), end_date=today
-            )
-        except Exception as e:
-            await warning(f"每日备份失败: {e}", channel=channel)
+
+    @staticmethod
+    async def daily_backup(due):
+        """
+        Backs up the day before the due time.
+
+        Args:
+            due (datetime.datetime): The due time of the run.
+        """
+        channel = directory.channel(cfg["daily"]["channel"])
+        day = due.date()
+        await backup_worker.backup(
+            channel=channel, start_date=day - timedelta(days=1), end_date=day
+        )